@@ -1,16 +1,108 @@
 #!/usr/bin/env python3
 
 import argparse
-from concurrent.futures import ThreadPoolExecutor
+import collections
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor, wait, FIRST_COMPLETED
 import subprocess
 import os
 import sys
 import ctypes
+import csv
+import functools
+import glob
+import heapq
+import hmac
+import http.server
+import itertools
+import json
+import secrets
 import shutil
+import threading
+import time
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 import tempfile
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tools'))
+try:
+    import odl
+except ImportError as e:
+    print(f"odl.py could not be imported ({e}), it will be run as a subprocess")
+    odl = None
+import rbodlclient
+import recyclebin
+import resultstore
+
+ODL_COLUMNS = ['Filename', 'File_Index', 'Timestamp', 'Code_File', 'Function', 'Params_Decoded']
+# odl.py keeps its keystore and settings in module globals, one folder at a time
+odl_lock = threading.Lock()
+# Seconds between an ODL event and the Recycle Bin DeletedOn time for them to be correlated
+CORRELATION_TOLERANCE = 60
+# Chunked mode: rows in the first chunk, and how many times a chunk's size its transforms may take
+FIRST_CHUNK_ROWS = 10000
+CHUNK_MEMORY_FACTOR = 4
+# Most sorted runs merged at once, more are first merged in passes to stay under the open file limit
+MAX_MERGE_RUNS = 64
+# Rows of an xlsx sheet, header included, writeRows continues on a new sheet after that
+XLSX_MAX_ROWS = 1048576
+# Per-stage run time, calls and rows, see timeStage()
+stage_stats = collections.Counter()
+metrics_lock = threading.Lock()
+# pandas 1.x has no format='ISO8601' (every string becomes NaT), it infers the
+# format per value instead. pandas 2 infers one format for all values, so
+# timestamps with and without microseconds need it
+ISO8601 = {'format': 'ISO8601'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+ODL_EXTENSIONS = ('.odl', '.odlgz', '.odlsent', '.aodl')
+ONEDRIVE_LOGS = os.path.join('AppData', 'Local', 'Microsoft', 'OneDrive', 'logs')
+
+def frameRows(result, args):
+    """Return the rows of the DataFrame a stage returned or was given, None if there is none."""
+    df = result if isinstance(result, pd.DataFrame) else args[0] if args and isinstance(args[0], pd.DataFrame) else None
+    return None if df is None else len(df)
+
+def timeStage(stage):
+    """Decorator adding a function's run time, calls and DataFrame rows to stage_stats with odl.timed, not timed without odl.py."""
+    def decorator(func):
+        if not odl:
+            return func
+        return functools.wraps(func)(odl.timed(stage, func, stage_stats, frameRows, metrics_lock))
+    return decorator
+
+def cacheMetrics(stats):
+    """Return {cache: {hits, misses, evictions, hit_rate}} of the odl.py cache counters in stats."""
+    caches = {}
+    for name, value in stats.items():
+        cache, _, kind = name.rpartition('_')
+        if cache.endswith('_cache') and kind in ('hits', 'misses', 'evictions'):
+            caches.setdefault(cache, {})[kind] = value
+    for cache in caches.values():
+        lookups = cache.get('hits', 0) + cache.get('misses', 0)
+        cache['hit_rate'] = cache.get('hits', 0) / lookups if lookups else None
+    return caches
+
+def collectStats():
+    """Return the stage timings of this process, with those of odl.py and its cache counters."""
+    stats = collections.Counter(stage_stats)
+    if odl:
+        stats.update({name: value for name, value in odl.parse_stats.items()
+                      if name.partition(': ')[0] in ('seconds', 'calls', 'items', 'bytes') or name.endswith(('_hits', '_misses', '_evictions'))})
+    return stats
+
+def writeMetrics(metrics_path, stats, total_seconds):
+    """Print the stage timings and cache hit rates and save them to a JSON file."""
+    metrics = odl.stage_metrics(stats) if odl else {}
+    caches = cacheMetrics(stats)
+    if odl:
+        odl.print_stage_metrics(metrics)
+    for cache, counts in sorted(caches.items()):
+        if counts['hit_rate'] is not None:
+            print(f"{cache}: {counts.get('hits', 0)} hits, {counts.get('misses', 0)} misses ({100 * counts['hit_rate']:.1f}% hit rate)")
+    with open(metrics_path, 'w', encoding='utf8') as f:
+        json.dump({'total_seconds': total_seconds, 'stages': metrics, 'caches': caches}, f, indent=1)
+    print(f"Metrics saved to {metrics_path}")
+
 def is_admin():
     """Check if the script is running with administrative privileges."""
     try:
@@ -24,7 +116,7 @@ def run_as_admin():
     params = ' '.join([f'"{arg}"' for arg in sys.argv[1:]])
     try:
         subprocess.run(["runas","/user:Administrator", f'python {script} {params}'],check=True)
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         print(f"Failed to elevate to admin: {e}")
         sys.exit(1)
 
@@ -49,113 +141,334 @@ def make_unique_folder(base_path, folder_name):
     os.makedirs(new_folder)
     return new_folder
 
-def readCSV(file, output_path, path, tool):
+def readCSV(file, output_path, path, tool, fmt='xlsx', writer=None, max_memory=None):
     """Reading CSV file for Parsing."""
     try:
+        if tool == 'odl' and max_memory:
+            reader = pd.read_csv(file, iterator=True)
+            return parseOdlChunked(chunkFrames(reader.get_chunk, max_memory), output_path, path, fmt)
         df = pd.read_csv(file)
-        df.dropna(how="all", inplace=True)
-        df.reset_index(drop=True, inplace=True)
-        if tool == 'odl':
-            return parseOdl(df.copy(), output_path, path)
-        elif tool == 'rb':
-            return parseRb(df.copy(), output_path, path)
+        return parseFrame(df, output_path, path, tool, fmt, writer)
     except PermissionError as e:
         print(f"Permission Denied: {e}")
     except Exception as e:
         print(f"An error occurred: {e}")
 
-def parseOdl(df_odl, output_path, path):
+def parseFrame(df, output_path, path, tool, fmt='xlsx', writer=None):
+    """Passing a tool's DataFrame to its parser, returns the parsed DataFrame."""
+    df.dropna(how="all", inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    if tool == 'odl':
+        return parseOdl(df.copy(), output_path, path, fmt, writer)
+    elif tool == 'rb':
+        return parseRb(df.copy(), output_path, path, fmt, writer)
+
+def odlFrame(rows):
+    """Return odl.py rows as a DataFrame."""
+    columns = {column: [] for column in ODL_COLUMNS}
+    for row in rows:
+        for column in ODL_COLUMNS:
+            columns[column].append(row[column])
+    # Same values as odl.py writes to its CSV, several strings are kept as a list,
+    # timestamps are converted once here instead of going through strings
+    columns['Timestamp'] = pd.to_datetime(columns['Timestamp'], errors='coerce')
+    columns['Params_Decoded'] = [str(value) if isinstance(value, list) else value for value in columns['Params_Decoded']]
+    df = pd.DataFrame(columns, columns=ODL_COLUMNS)
+    if df.empty:
+        # Without rows pandas makes the empty lists float64 columns, the string transforms need object ones
+        df = df.astype({column: object for column in ODL_COLUMNS if column != 'Timestamp'})
+    return df
+
+@timeStage('runOdl')
+def runOdl(path, obf, all_kval, all_data, cache_dir=None, index_dir=None):
+    """Running odl.py in-process, returns its rows as a DataFrame."""
+    with odl_lock:
+        return odlFrame(odl.parse_odl_folder(path, obf, all_kval, all_data, index_dir=index_dir, cache_dir=cache_dir))
+
+def runOdlChunked(path, obf, all_kval, all_data, output_path, fmt, max_memory, cache_dir=None, index_dir=None):
+    """Running odl.py in-process in memory-bounded chunks, see parseOdlChunked."""
+    with odl_lock:
+        rows = odl.parse_odl_folder(path, obf, all_kval, all_data, index_dir=index_dir, cache_dir=cache_dir)
+        return parseOdlChunked(chunkFrames(lambda count: odlFrame(itertools.islice(rows, count)), max_memory), output_path, path, fmt)
+
+def chunkFrames(get_chunk, max_memory):
+    """Yielding DataFrames from get_chunk(rows), sized to fit max_memory bytes with their transforms."""
+    rows = FIRST_CHUNK_ROWS
+    while True:
+        try:
+            df = get_chunk(rows)
+        except StopIteration:
+            return
+        if df.empty:
+            return
+        yield df
+        bytes_per_row = df.memory_usage(deep=True).sum() / len(df)
+        rows = max(1000, int(max_memory / CHUNK_MEMORY_FACTOR / bytes_per_row))
+
+def mapCategories(series, transform):
+    """Running a string transform once per unique value, returns a categorical Series."""
+    series = series.astype('category')
+    categories = series.cat.categories.to_series()
+    return series.map(dict(zip(categories, transform(categories))))
+
+def transformOdl(df_odl, path):
+    """Cleaning up the ODL DataFrame, newest records first."""
+    df_odl.drop(['File_Index'], axis=1, inplace=True)
+    # Log files, code files and functions repeat a lot, they are transformed per unique value
+    df_odl['Filename'] = mapCategories(df_odl['Filename'], lambda names: [os.path.join(path, name) for name in names])
+    df_odl['Code_File'] = df_odl['Code_File'].astype('category')
+    df_odl['Function'] = mapCategories(df_odl['Function'], lambda functions: functions.str.replace(r'(?<!^)(?=[A-Z])',' ', regex=True).str.replace('::',' -'))
+    df_odl['Timestamp'] = pd.to_datetime(df_odl['Timestamp'], errors='coerce', **ISO8601).dt.floor('s')
+    df_odl = move_column_to_first(df_odl, 'Timestamp')
+    return df_odl.sort_values(by='Timestamp', ascending=False, kind='stable')
+
+def mergeRuns(runs):
+    """Yielding the rows of sorted CSV runs merged, newest first. Runs are stable merged in order, as one full sort would be."""
+    files = [open(run, 'r', encoding='utf8', newline='') for run in runs]
+    try:
+        yield from heapq.merge(*(csv.reader(f) for f in files), key=lambda row: row[0], reverse=True)
+    finally:
+        for f in files:
+            f.close()
+
+def reduceRuns(runs, run_folder, max_runs=MAX_MERGE_RUNS):
+    """Merging neighbouring groups of max_runs runs into one until at most max_runs are left, returns those."""
+    while len(runs) > max_runs:
+        merged = []
+        for start in range(0, len(runs), max_runs):
+            group = runs[start:start + max_runs]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            run = os.path.join(run_folder, f'pass{len(runs)}-{len(merged)}.csv')
+            with open(run, 'w', encoding='utf8', newline='') as f, contextlib.closing(mergeRuns(group)) as rows:
+                csv.writer(f, lineterminator='\n').writerows(rows)
+            for old_run in group:
+                os.remove(old_run)
+            merged.append(run)
+        runs = merged
+    return runs
+
+@timeStage('parseOdl')
+def parseOdlChunked(chunks, output_path, path, fmt='xlsx'):
+    """Parsing ODL DataFrame chunks into sorted runs on disk, then merging them into the output.
+    Returns only the records that name a file, which is all that the concurrency check needs."""
+    try:
+        file_events = []
+        widths = {}
+        with tempfile.TemporaryDirectory(dir=output_path) as run_folder:
+            runs = []
+            for df_odl in chunks:
+                df_odl.dropna(how="all", inplace=True)
+                df_odl = transformOdl(df_odl, path)
+                run = os.path.join(run_folder, f'run{len(runs)}.csv')
+                df_odl.to_csv(run, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S')
+                runs.append(run)
+                for col in df_odl.columns:
+                    widths[col] = max(widths.get(col, len(col)), df_odl[col].astype(str).map(len).max())
+                file_events.append(df_odl[df_odl['Params_Decoded'].str.contains(r"\\[^\\]+']", na=False)])
+            if not runs:
+                widths = {col: len(col) for col in transformOdl(odlFrame([]), path).columns}
+            print(f"Parsed_odl: merging {len(runs)} sorted runs")
+            runs = reduceRuns(runs, run_folder)
+            with contextlib.closing(mergeRuns(runs)) as rows:
+                writeRows(rows, list(widths), output_path, 'Parsed_odl', fmt, widths)
+        if not file_events:
+            return transformOdl(odlFrame([]), path)
+        return pd.concat(file_events, ignore_index=True)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+@timeStage('parseOdl')
+def parseOdl(df_odl, output_path, path, fmt='xlsx', writer=None):
     """Parsing ODL file."""
     try:
-        df_odl.drop(['File_Index'], axis=1, inplace=True)
-        df_odl['Filename'] = df_odl['Filename'].apply(lambda x: os.path.join(path, x))
-        df_odl['Timestamp'] = df_odl['Timestamp'].str.split('.').str[0]
-        df_odl['Function'] = df_odl['Function'].str.replace(r'(?<!^)(?=[A-Z])',' ', regex=True).str.replace('::',' -')
-        df_odl = move_column_to_first(df_odl, 'Timestamp')
-        df_odl = df_odl.sort_values(by='Timestamp', ascending=False)
-        return writeCSV(df_odl.copy(), output_path, 'Parsed_odl.xlsx')
+        df_odl = transformOdl(df_odl, path)
+        return saveFrame(df_odl, output_path, 'Parsed_odl', fmt, writer)
     except Exception as e:
         print(f"An error occurred: {e}")
 
-def parseRb(df_rb, output_path, path):
+@timeStage('parseRb')
+def parseRb(df_rb, output_path, path, fmt='xlsx', writer=None):
     """Parsing RBCmd file."""
     try:
         df_rb['UserSID'] = os.path.basename(path)
         df_rb = move_column_to_first(df_rb, 'UserSID')
         df_rb = move_column_to_first(df_rb, 'DeletedOn')
         df_rb = df_rb.sort_values(by='DeletedOn', ascending=False)
-        return writeCSV(df_rb.copy(), output_path, 'Parsed_rb.xlsx')
+        return saveFrame(df_rb, output_path, 'Parsed_rb', fmt, writer)
     except Exception as e:
         print(f"An error occurred: {e}")
 
-def parseConcurrency(df_concurrency, output_path):
-    """Parsing concurrency CSV file."""
+def parseConcurrency(cc_df, df_odl, df_rb, df_merged, output_path, fmt='xlsx', presentation=False, partial_odl=False):
+    """Parsing the concurrency DataFrame and writing the result. With partial_odl (chunked
+    mode), df_odl only holds the records that name a file, and its sheet is named for that."""
     try:
-        odl_file = os.path.join(output_path, 'Parsed_odl.xlsx')
-        rb_file = os.path.join(output_path, 'Parsed_rb.xlsx')
         output = os.path.join(output_path, 'Parsed_concurrency.xlsx')
-        merged_cc = os.path.join(output_path, 'RawMergedDataset.xlsx')
-
-        if os.path.exists(odl_file) and os.path.exists(rb_file):
-            df_odl = pd.read_excel(odl_file)
-            df_rb = pd.read_excel(rb_file)
-            df_merged = pd.read_excel(merged_cc)
-
-            if os.path.exists(df_concurrency):
-                cc_df = pd.read_csv(df_concurrency)
-                cc_df.rename(columns={'Filename': 'Logfile', 'FileName': 'FileLocation'}, inplace=True)
-                cc_df.drop(['Timestamp','Code_File','Function','SourceName','FileType','rm_file'], axis=1,inplace=True)
-                for lst in ['Params_Decoded','Logfile','UserSID','FileLocation','FileSize','DeletedFile','DeletedOn']:
-                    cc_df = move_column_to_first(cc_df, lst)
-                cc_df['DeletedOn'] = pd.to_datetime(cc_df['DeletedOn'])
-
-                dfs = [cc_df, df_odl, df_rb, df_merged]
-                dfnames = ['Concurrency_Parsed','ODL_Parsed','RB_Parsed','Raw_Merged']
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    for df, fname in zip(dfs, dfnames):
-                        df.to_excel(writer, index=False, sheet_name=fname)
-                        worksheet = writer.sheets[fname]
-                        for col_num, col in enumerate(df.columns):
-                            max_length = max(df[col].astype(str).map(len).max(),len(col))
-                            colWidth = min(max_length, 100)
-                            worksheet.set_column(col_num, col_num, colWidth)
-                return output
-            else:
-                print(f"Concurrency CSV file not found at {df_concurrency}")
-        else:
-            print("Parsed ODL or RB files are missing.")
+        cc_df = cc_df.rename(columns={'Filename': 'Logfile', 'FileName': 'FileLocation'})
+        cc_df.drop(['Timestamp','Code_File','Function','SourceName','FileType','rm_file'], axis=1,inplace=True)
+        for lst in ['Params_Decoded','Logfile','UserSID','FileLocation','FileSize','DeletedFile','DeletedOn']:
+            cc_df = move_column_to_first(cc_df, lst)
+        cc_df['DeletedOn'] = pd.to_datetime(cc_df['DeletedOn'])
+        if fmt != 'xlsx':
+            cc_output = writeCSV(cc_df, output_path, 'Parsed_concurrency', fmt)
+            if not presentation:
+                return cc_output
+
+        dfs = [cc_df, df_odl, df_rb, df_merged]
+        dfnames = ['Concurrency_Parsed','ODL_File_Events' if partial_odl else 'ODL_Parsed','RB_Parsed','Raw_Merged']
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+            for df, fname in zip(dfs, dfnames):
+                writeSheet(writer, df, fname)
+        print(f"Parsed_concurrency.xlsx has been written to {output}")
+        return output
     except Exception as e:
         print(f"An error occurred in parseConcurrency: {e}")
 
-def writeCSV(df, output_path, filename):
-    """Writing RBCmd or ODL file."""
+def writeSheet(writer, df, sheet_name):
+    """Writing a DataFrame to an xlsx sheet with fitted column widths."""
+    df.to_excel(writer, index=False, sheet_name=sheet_name)
+    worksheet = writer.sheets[sheet_name]
+    for col_num, col in enumerate(df.columns):
+        max_length = max(df[col].astype(str).map(len).max(), len(col))
+        colWidth = min(max_length, 100)
+        worksheet.set_column(col_num, col_num, colWidth)
+
+@timeStage('writeCSV')
+def writeCSV(df, output_path, name, fmt='xlsx'):
+    """Writing RBCmd or ODL file as xlsx, csv, parquet or feather."""
     try:
+        filename = f'{name}.{fmt}'
         output = os.path.join(output_path, filename)
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name='Parsed')
-            worksheet = writer.sheets['Parsed']
-            for col_num, col in enumerate(df.columns):
-                max_length = max(df[col].astype(str).map(len).max(), len(col))
-                colWidth = min(max_length, 100)
-                worksheet.set_column(col_num, col_num, colWidth)
+        if fmt == 'xlsx':
+            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+                writeSheet(writer, df, 'Parsed')
+        elif fmt == 'csv':
+            df.to_csv(output, index=False, chunksize=100000)
+        elif fmt == 'parquet':
+            df.to_parquet(output, index=False)
+        elif fmt == 'feather':
+            df.reset_index(drop=True).to_feather(output)
         print(f"{filename} DataFrame has been written to {output}")
+        return output
     except Exception as e:
         print(f"An error occurred on writeCSV: {e}")
 
+def saveFrame(df, output_path, name, fmt='xlsx', writer=None):
+    """Writing a DataFrame with writeCSV, in the background if a writer executor is given, returns df."""
+    if writer:
+        writer.submit(writeCSV, df.copy(), output_path, name, fmt)
+    else:
+        writeCSV(df.copy(), output_path, name, fmt)
+    return df
+
+@timeStage('writeCSV')
+def writeRows(rows, columns, output_path, name, fmt='xlsx', widths=None):
+    """Writing rows of strings as they come, for output larger than memory."""
+    filename = f'{name}.{fmt}'
+    output = os.path.join(output_path, filename)
+    if fmt == 'csv':
+        with open(output, 'w', encoding='utf8', newline='') as f:
+            csv_writer = csv.writer(f, lineterminator=os.linesep)
+            csv_writer.writerow(columns)
+            csv_writer.writerows(rows)
+    elif fmt == 'xlsx':
+        import xlsxwriter
+        with xlsxwriter.Workbook(output, {'constant_memory': True}) as workbook:
+            date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+            timestamp_col = columns.index('Timestamp') if 'Timestamp' in columns else -1
+            sheets = 0
+            row_num = XLSX_MAX_ROWS
+            for row in rows:
+                if row_num == XLSX_MAX_ROWS:
+                    # Past the last row of a sheet xlsxwriter drops rows without raising, so the rest go on to Parsed_2, ...
+                    sheets += 1
+                    worksheet = workbook.add_worksheet('Parsed' if sheets == 1 else f'Parsed_{sheets}')
+                    for col_num, col in enumerate(columns):
+                        worksheet.set_column(col_num, col_num, min((widths or {}).get(col, len(col)), 100))
+                    worksheet.write_row(0, 0, columns)
+                    row_num = 1
+                if worksheet.write_row(row_num, 0, row) == -1:
+                    raise ValueError(f"row {row_num} could not be written to {filename}")
+                if timestamp_col >= 0 and row[timestamp_col]:
+                    worksheet.write_datetime(row_num, timestamp_col, pd.Timestamp(row[timestamp_col]).to_pydatetime(), date_format)
+                row_num += 1
+            if not sheets:
+                worksheet = workbook.add_worksheet('Parsed')
+                worksheet.write_row(0, 0, columns)
+            if sheets > 1:
+                print(f"{filename}: more rows than an xlsx sheet holds, they were written to {sheets} sheets (Parsed, Parsed_2, ...)")
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        file_writer = None
+        try:
+            while True:
+                batch = list(itertools.islice(rows, 100000))
+                if not batch:
+                    break
+                df = pd.DataFrame(batch, columns=columns)
+                if 'Timestamp' in df.columns:
+                    df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce')
+                table = pa.Table.from_pandas(df, preserve_index=False, schema=file_writer.schema if file_writer else None)
+                if not file_writer:
+                    file_writer = pq.ParquetWriter(output, table.schema) if fmt == 'parquet' else pa.ipc.new_file(output, table.schema)
+                file_writer.write_table(table)
+        finally:
+            if file_writer:
+                file_writer.close()
+    print(f"{filename} has been written to {output}")
+    return output
+
+def readFrame(output_path, name, fmt='xlsx'):
+    """Reading back a DataFrame written by writeCSV."""
+    output = os.path.join(output_path, f'{name}.{fmt}')
+    if fmt == 'xlsx':
+        return pd.read_excel(output)
+    elif fmt == 'csv':
+        return pd.read_csv(output)
+    elif fmt == 'parquet':
+        return pd.read_parquet(output)
+    elif fmt == 'feather':
+        return pd.read_feather(output)
+
+@timeStage('runRb')
+def runRb(path):
+    """Reading the $I files of a Recycle Bin folder in-process, returns a DataFrame."""
+    return pd.DataFrame(recyclebin.parse_recycle_bin(path), columns=recyclebin.RB_COLUMNS)
+
+def rbPath(path):
+    """Return the Recycle Bin folder for a UserSID, or path itself if it is a folder."""
+    if os.path.isdir(path):
+        return path
+    return os.path.join(r"C:\$Recycle.Bin", path)
+
 def runTool(args):
     """Running RBCmd or ODL tool."""
-    tool, path, output_path, obf, all_kval, all_data = args
+    tool, path, output_path, obf, all_kval, all_data, use_subprocess, fmt, max_memory, cache_dir, index_dir, writer = args
     try:
+        if tool == 'odl' and odl and not use_subprocess:
+            print(f'Running tool: odl.py (in-process)')
+            if max_memory:
+                return runOdlChunked(path, obf, all_kval, all_data, output_path, fmt, max_memory, cache_dir, index_dir)
+            return parseFrame(runOdl(path, obf, all_kval, all_data, cache_dir, index_dir), output_path, path, tool, fmt, writer)
+        if tool == 'rb' and not use_subprocess:
+            print(f'Running tool: recyclebin.py (in-process)')
+            path = rbPath(path)
+            return parseFrame(runRb(path), output_path, path, tool, fmt, writer)
+
         with tempfile.NamedTemporaryFile(delete=True, suffix=".csv") as temp_csv:
             output_file = temp_csv.name
             temp_directory = os.path.dirname(output_file)
 
         if tool == 'odl':
-            odl = ['python', r'tools\odl.py', path, '-o', output_file]
-            if obf: odl.extend(['-s', obf])
-            if all_kval: odl.append('-k')
-            if all_data: odl.append('-d')
-            commands = [odl]
+            odl_command = ['python', r'tools\odl.py', path, '-o', output_file]
+            if obf: odl_command.extend(['-s', obf])
+            if all_kval: odl_command.append('-k')
+            if all_data: odl_command.append('-d')
+            if cache_dir: odl_command.extend(['--cache', cache_dir])
+            if index_dir: odl_command.extend(['--index_dir', index_dir])
+            commands = [odl_command]
             print(f'Running tool: odl.py')
 
         if tool == 'rb':
@@ -175,12 +488,14 @@ def runTool(args):
             ]
             print(f'Running tool: RBCmd.exe')
 
-        runParsers(commands, temp_directory, output_path, path, tool)
+        df = runParsers(commands, temp_directory, output_path, path, tool, fmt, writer, max_memory)
         if tool == 'rb': shutil.rmtree(new_folder)
+        return df
     except Exception as e:
         print(f"An error occurred on run_tool: {e}")
 
-def runParsers(commands, directory, output_path, path, tool):
+@timeStage('runParsers')
+def runParsers(commands, directory, output_path, path, tool, fmt='xlsx', writer=None, max_memory=None):
     """Runs the given commands with Subprocesses"""
     try:
         for command in commands:
@@ -198,8 +513,9 @@ def runParsers(commands, directory, output_path, path, tool):
         filename = os.path.basename(output)
         output_file = os.path.join(directory, filename)
 
-        readCSV(output_file, output_path, path, tool)
+        df = readCSV(output_file, output_path, path, tool, fmt, writer, max_memory)
         os.remove(output_file)
+        return df
 
     except subprocess.CalledProcessError as e:
         print(f"Command Subprocess Error on runParser: {e}")
@@ -207,97 +523,462 @@ def runParsers(commands, directory, output_path, path, tool):
         print(f"An error occurred on runParser: {e}")
 
 
-def checkConcurrencies(output_path):
-    """Check for concurrent times in ODL and RB outputs and write to a CSV file."""
-    odl_file = os.path.join(output_path, 'Parsed_odl.xlsx')
-    rb_file = os.path.join(output_path, 'Parsed_rb.xlsx')
-
-    if os.path.exists(odl_file) and os.path.exists(rb_file):
-        df_odl = pd.read_excel(odl_file)
-        df_rb = pd.read_excel(rb_file)
-
+def correlateDeletions(df_odl, df_rb, tolerance=CORRELATION_TOLERANCE):
+    """Joining ODL events to Recycle Bin items of the same file name deleted within tolerance seconds."""
+    df_odl = df_odl.dropna(subset=['rm_file', 'Timestamp']).sort_values(['rm_file', 'Timestamp'])
+    df_rb = df_rb.dropna(subset=['DeletedFile', 'DeletedOn'])
+    window = np.timedelta64(int(tolerance * 1000000), 'us')
+    odl_times = df_odl['Timestamp'].to_numpy()
+    rb_times = df_rb['DeletedOn'].to_numpy()
+    odl_groups = df_odl.groupby('rm_file', sort=False).indices
+
+    # Per file name, the ODL times are sorted so every RB item's window is a slice
+    odl_rows, rb_rows = [], []
+    for name, rb_group in df_rb.groupby('DeletedFile', sort=False).indices.items():
+        odl_group = odl_groups.get(name)
+        if odl_group is None:
+            continue
+        times = odl_times[odl_group]
+        starts = np.searchsorted(times, rb_times[rb_group] - window, 'left')
+        counts = np.searchsorted(times, rb_times[rb_group] + window, 'right') - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        odl_rows.append(odl_group[np.repeat(starts, counts) + offsets])
+        rb_rows.append(np.repeat(rb_group, counts))
+    odl_rows = np.concatenate(odl_rows) if odl_rows else np.array([], dtype=int)
+    rb_rows = np.concatenate(rb_rows) if rb_rows else np.array([], dtype=int)
+
+    cc_df = pd.concat([df_odl.iloc[odl_rows].reset_index(drop=True), df_rb.iloc[rb_rows].reset_index(drop=True)], axis=1)
+    return cc_df.sort_values(by=['Timestamp', 'DeletedOn'], ascending=False, ignore_index=True)
+
+@timeStage('checkConcurrencies')
+def checkConcurrencies(output_path, fmt='xlsx', presentation=False, df_odl=None, df_rb=None, writer=None, tolerance=CORRELATION_TOLERANCE, partial_odl=False):
+    """Check for concurrent times in the ODL and RB DataFrames (or their output files) and write the result."""
+    if df_odl is None and os.path.exists(os.path.join(output_path, f'Parsed_odl.{fmt}')):
+        df_odl = readFrame(output_path, 'Parsed_odl', fmt)
+    if df_rb is None and os.path.exists(os.path.join(output_path, f'Parsed_rb.{fmt}')):
+        df_rb = readFrame(output_path, 'Parsed_rb', fmt)
+
+    if df_odl is not None and df_rb is not None:
         if 'Timestamp' in df_odl.columns and 'DeletedOn' in df_rb.columns:
-            df_odl['Timestamp'] = pd.to_datetime(df_odl['Timestamp'])
-            df_rb['DeletedOn'] = pd.to_datetime(df_rb['DeletedOn'])
+            odl_df = df_odl.copy()
+            rb_df = df_rb.copy()
+            odl_df['Timestamp'] = pd.to_datetime(odl_df['Timestamp'])
+            rb_df['DeletedOn'] = pd.to_datetime(rb_df['DeletedOn'])
 
-            df_odl['rm_file'] = df_odl['Params_Decoded'].str.extract(r'\\([^\\]+)\']')
-            df_rb['DeletedFile'] = df_rb['FileName'].str.extract(r'([^\\]+)$')
-            cc_df = pd.merge(df_odl, df_rb, left_on='rm_file', right_on='DeletedFile', how='inner')
-            writeCSV(cc_df.copy(), output_path, "RawMergedDataset.xlsx")
-            cc_df = cc_df[cc_df['Params_Decoded'].str.contains("FILE_ACTION_REMOVED")]
+            odl_df['rm_file'] = odl_df['Params_Decoded'].str.extract(r'\\([^\\]+)\']')
+            rb_df['DeletedFile'] = rb_df['FileName'].str.extract(r'([^\\]+)$')
+            removed_df = odl_df[odl_df['Params_Decoded'].str.contains("FILE_ACTION_REMOVED", na=False)]
+
+            # Removal events are the concurrencies, all events on the file around its deletion are kept as context
+            cc_df = correlateDeletions(removed_df, rb_df, tolerance)
+            merged_df = correlateDeletions(odl_df, rb_df, tolerance)
+            saveFrame(merged_df, output_path, "RawMergedDataset", fmt, writer)
 
             if not cc_df.empty:
-                concurrency_file = os.path.join(output_path, 'concurrency.csv')
-                cc_df.to_csv(concurrency_file, index=False)
+                return parseConcurrency(cc_df, df_odl, df_rb, merged_df, output_path, fmt, presentation, partial_odl)
             else:
                 print("No concurrency found.")
         else:
             print("Timestamp columns not found in one or both dataframes.")
     else:
-        print(f"One or both of the output files do not exist in {output_path}.")
-
-    parseConcurrency(os.path.join(output_path, 'concurrency.csv'), output_path)
-    deleteCCfile(concurrency_file)
-
-
-def deleteCCfile(file_path):
-    """Delete the concurrency CSV file."""
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        print(f"One or both of the parsed ODL and RB outputs are missing in {output_path}.")
+
+def readManifest(manifest):
+    """Return the evidence roots listed in a manifest file, one per line, # for comments."""
+    with open(manifest, 'r', encoding='utf8') as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+def findOdlFolders(root):
+    """Return the OneDrive log folders in an evidence root, user profile or logs folder."""
+    root = glob.escape(root)
+    patterns = [root, os.path.join(root, '*'), os.path.join(root, ONEDRIVE_LOGS, '*'),
+                os.path.join(root, '*', ONEDRIVE_LOGS, '*'), os.path.join(root, 'Users', '*', ONEDRIVE_LOGS, '*')]
+    folders = []
+    for pattern in patterns:
+        for folder in sorted(glob.glob(pattern)):
+            if folder not in folders and os.path.isdir(folder) and any(name.lower().endswith(ODL_EXTENSIONS) for name in os.listdir(folder)):
+                folders.append(folder)
+    return folders
+
+def findSidFolders(root):
+    """Return the Recycle Bin UserSID folders in an evidence root or $Recycle.Bin folder."""
+    if os.path.basename(os.path.normpath(root)).startswith('S-1-'):
+        return [root]
+    recycle_bins = [root] if os.path.basename(os.path.normpath(root)).lower() == '$recycle.bin' else \
+        [os.path.join(root, name) for name in os.listdir(root) if name.lower() == '$recycle.bin']
+    folders = []
+    for recycle_bin in recycle_bins:
+        for name in sorted(os.listdir(recycle_bin)):
+            if name.startswith('S-1-') and os.path.isdir(os.path.join(recycle_bin, name)):
+                folders.append(os.path.join(recycle_bin, name))
+    return folders
+
+def jobName(tool, root, path):
+    """Return the output folder name of a batch job, e.g. odl-alice_Business1 or rb-S-1-5-21-...."""
+    skip = ('.', 'Users', 'AppData', 'Local', 'Microsoft', 'OneDrive', 'logs', '$Recycle.Bin', '$RECYCLE.BIN')
+    parts = [part for part in os.path.relpath(path, root).split(os.sep) if part not in skip]
+    return f"{tool}-{'_'.join(parts) or os.path.basename(os.path.normpath(path))}"
+
+def discoverJobs(roots, tools, output_path, options):
+    """Return the batch jobs of all evidence roots, each with its own output folder."""
+    jobs = []
+    for index, root in enumerate(roots, 1):
+        if not os.path.isdir(root):
+            print(f"Evidence root {root} is not a folder, skipping it.")
+            continue
+        root_output = os.path.join(output_path, f"{index:02}-{os.path.basename(os.path.normpath(root)) or 'root'}")
+        found = []
+        if 'odl' in tools: found.extend(('odl', folder) for folder in findOdlFolders(root))
+        if 'rb' in tools: found.extend(('rb', folder) for folder in findSidFolders(root))
+        print(f"{root}: {len(found)} job(s)")
+        for tool, path in found:
+            job_output = os.path.join(root_output, jobName(tool, root, path))
+            jobs.append({'root': root_output, 'tool': tool, 'path': path,
+                         'args': [tool, path, job_output] + options + [None]})
+    return jobs
+
+def runJob(job, keep_frame):
+    """Running one batch job in a pool process, returns (rows, DataFrame if keep_frame, stage timings)."""
+    os.makedirs(job['args'][2], exist_ok=True)
+    stage_stats.clear()
+    if odl:
+        odl.parse_stats.clear()
+        # Pool processes are reused by later batches, see serve
+        if job.get('metrics'):
+            odl.enable_timings()
         else:
-            print(f"File {file_path} not found.")
+            odl.disable_timings()
+    df = runTool(job['args'])
+    if df is None:
+        raise RuntimeError(f"{job['tool']} failed on {job['path']}")
+    return len(df), df if keep_frame else None, collectStats()
+
+def runBatch(jobs, workers, retries, keep_frames, db=None, pools=None):
+    """Running batch jobs on a bounded process pool with retries, returns {root: {tool: [DataFrames]}}."""
+    frames = {}
+    return_frames = keep_frames or bool(db)
+    if pools is None:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        # A server keeps its pools (workers -> executor) running between batches
+        if workers not in pools:
+            pools[workers] = ProcessPoolExecutor(max_workers=workers)
+        pool = contextlib.nullcontext(pools[workers])
+    with pool as executor, tqdm(total=len(jobs), desc="Batch jobs") as progress:
+        pending = {executor.submit(runJob, job, return_frames): (job, 0, time.perf_counter()) for job in jobs}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, attempt, start = pending.pop(future)
+                label = f"{job['tool']} {job['path']}"
+                try:
+                    rows, df, stats = future.result()
+                except Exception as e:
+                    if attempt < retries:
+                        tqdm.write(f"{label} failed ({e}), retrying ({attempt + 1}/{retries})")
+                        pending[executor.submit(runJob, job, return_frames)] = (job, attempt + 1, time.perf_counter())
+                        continue
+                    tqdm.write(f"{label} failed: {e}")
+                else:
+                    tqdm.write(f"{label} done, {rows} rows in {time.perf_counter() - start:.1f}s -> {job['args'][2]}")
+                    with metrics_lock:
+                        stage_stats.update(stats)
+                    if db and df is not None:
+                        storeResults(db, job['tool'], job['path'], df)
+                    if keep_frames and df is not None:
+                        frames.setdefault(job['root'], {}).setdefault(job['tool'], []).append(df)
+                progress.update(1)
+    return frames
+
+@timeStage('storeResults')
+def storeResults(db, tool, path, df):
+    """Appending a tool's parsed rows to the SQLite result store."""
+    try:
+        rows, added = resultstore.store_frame(db, tool, path, df)
+        print(f"Stored {rows} {tool} rows of {path} in {db}, {added} new")
     except Exception as e:
-        print(f"Error deleting file {file_path}: {e}")
+        print(f"An error occurred on storeResults: {e}")
+
+def finishRun(args, start_time, profiler):
+    """Save the profile and metrics of the run if they were asked for."""
+    if profiler:
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        print(f"Profile saved to {args.profile}")
+    if args.metrics:
+        writeMetrics(args.metrics, collectStats(), time.perf_counter() - start_time)
+
+class ServerLog:
+    """File-like object sending what a run prints to the client, as JSON lines."""
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        if text:
+            try:
+                self.wfile.write(json.dumps({'log': text}).encode() + b'\n')
+                self.wfile.flush()
+            except OSError:
+                pass # the client went away, the run still finishes
+        return len(text)
+
+    def flush(self):
+        pass
+
+class ServerHandler(http.server.BaseHTTPRequestHandler):
+    """Requests of rbodlclient.py: POST /run, GET /status and POST /stop."""
+    def authorized(self):
+        """Check the token of the request, answering 403 if it is wrong."""
+        if hmac.compare_digest(self.headers.get('X-Token', ''), self.server.state['token']):
+            return True
+        self.send_error(403)
+        return False
+
+    def sendJson(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        if self.path != '/status':
+            self.send_error(404)
+            return
+        state = self.server.state
+        self.sendJson({'pid': os.getpid(), 'uptime_seconds': time.time() - state['started'], 'runs': state['runs'],
+                       'busy': state['lock'].locked(), 'pools': sorted(state['pools']),
+                       'decrypt_cache': len(odl.decrypt_cache) if odl else 0,
+                       'loaded_files': len(odl.loaded_files) if odl else 0})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if self.path == '/stop':
+            self.sendJson({'stopping': True})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        if self.path != '/run':
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        result = runRequest(self.server.state, request['argv'], request.get('cwd'), ServerLog(self.wfile))
+        self.wfile.write(json.dumps({'result': result}).encode() + b'\n')
+
+    def log_message(self, format, *args):
+        pass
+
+def runRequest(state, argv, cwd, log):
+    """Running one client command line, one at a time, with its output sent to log. Returns the result for the client."""
+    with state['lock']:
+        start = time.perf_counter()
+        result = {'ok': False}
+        previous_cwd = os.getcwd()
+        try:
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                if cwd:
+                    os.chdir(cwd)
+                if argv[:1] == ['query']:
+                    resultstore.main(argv[1:])
+                    result = {'ok': True}
+                else:
+                    result = {'ok': True, 'output_path': runCommand(argv, state['pools'])}
+        except SystemExit as e:
+            # argparse errors and --help
+            result = {'ok': not e.code, 'error': 'invalid arguments'}
+        except BrokenExecutor as e:
+            for pool in state['pools'].values():
+                pool.shutdown(wait=False)
+            state['pools'].clear()
+            result['error'] = f"the worker pool broke ({e}), it will be restarted"
+        except Exception as e:
+            result['error'] = f"An error occurred: {e}"
+        finally:
+            os.chdir(previous_cwd)
+            # The next request starts without the timings and counters of this one
+            stage_stats.clear()
+            if odl:
+                odl.disable_timings()
+                odl.parse_stats.clear()
+        state['runs'] += 1
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+def serve(argv):
+    """Serving rbodlclient.py on 127.0.0.1, keeping imports, keystores, maps, caches and batch pools warm between runs."""
+    parser = argparse.ArgumentParser(description="Keep RBODLcmd.py running for rbodlclient.py")
+    parser.add_argument('--port', type=int, default=0, help='Port on 127.0.0.1 (default any free port)')
+    args = parser.parse_args(argv)
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', args.port), ServerHandler)
+    server.state = {'token': secrets.token_hex(16), 'lock': threading.Lock(), 'pools': {}, 'runs': 0, 'started': time.time()}
+    port = server.server_address[1]
+    rbodlclient.write_server_info(port, server.state['token'])
+    print(f"Serving on 127.0.0.1:{port}, run jobs with: rbodlclient.py <RBODLcmd.py arguments>, stop with: rbodlclient.py stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pool in server.state['pools'].values():
+            pool.shutdown()
+        info = rbodlclient.read_server_info()
+        if info and info.get('pid') == os.getpid():
+            os.remove(rbodlclient.server_info_path())
+        print("Server stopped")
 
 def main():
     """
     NSSECU3 group 12 Windows Forensics Practical project
 
     -t <tool>, 	--tool 		        - Specify which tool, choices: odl (odl.py) and/or rbc (RBCmd.exe)
-    -p <path>,	--path 		        - Path to ODL logs or Recycle Bin UserSID
+    -p <path>,	--path 		        - Path to ODL logs, Recycle Bin UserSID or UserSID folder
     -o <path>, 	--output_path 	    - Path to output directory
     -s , 	    --obfstrmap	        - (ODL only) Path to ObfuscationStringMap.txt or general.keynote if not in odl_folder (off by default)
     -k , 	    --all_kval 	        - (ODL only) For repeated keys in ObfuscationMap, get all values | delimited (off by default)
     -d , 	    --all_data 	        - (ODL only) Show all data (off by default)
+    -c , 	    --check 	        - Run the concurrency check of both tools
+    --tolerance <sec>               - Seconds between an ODL event and the Recycle Bin deletion time to correlate them (default 60)
+    -f <fmt>,	--format 	        - Output format: xlsx (default), csv, parquet or feather
+    -x , 	    --xlsx 	            - With --format other than xlsx, also write the Parsed_concurrency.xlsx workbook
+    --subprocess 	                - Run odl.py and RBCmd.exe as separate processes instead of in-process
+    -m <MB>,	--max_memory        - (ODL only) Parse in chunks within this memory budget, sorting through runs on disk
+    --cache <dir>                   - (ODL only) Reuse the rows of ODL files parsed before, kept decrypted in <dir>\parsecache.sqlite (off by default)
+    --index_dir <dir>               - (ODL only) Compile ObfuscationStringMap into an index in <dir>, reused by later runs (off by default)
+    --db <file>                     - Also append the parsed ODL and RB rows to a SQLite result store (not with -m for ODL)
+    query <db> [filters]            - Look up rows in a result store, see query --help (e.g. query case.db -f Report.docx --from 2024-01-31)
+    serve [--port <n>]              - Stay running with everything loaded, and run the jobs of tools\rbodlclient.py (same arguments)
+    --metrics <file>                - Time each stage (odl.py stages too) and save the timings to a JSON file
+    --profile <file>                - Run under cProfile, tools one after the other, and save the profile
+    -b <file>,	--batch 	        - Manifest of evidence roots (one per line), their OneDrive log folders and Recycle Bin SIDs are found and parsed
+    -j <n>, 	--jobs 		        - (batch only) Number of parallel jobs (default CPU count)
+    --retries <n>                   - (batch only) Times a failed job is retried (default 1)
 
     (Note: If '--output_path' is not given, default directory will be exe directory)
     (Note: To get UserSID, refer to https://www.precysec.com/post/how-to-recover-deleted-files-windows-recycle-bin-forensics)
     """
 
-    if not is_admin():
+    if sys.argv[1:2] == ['query']:
+        resultstore.main(sys.argv[2:])
+        return
+
+    # Only Windows has admin elevation, elsewhere (mounted images, synthetic
+    # fixtures) the evidence is read with the permissions of the user
+    if os.name == 'nt' and not is_admin():
         print("Not running as admin, attempting to relaunch with admin privileges...")
         run_as_admin()
         return
 
+    if sys.argv[1:2] == ['serve']:
+        serve(sys.argv[2:])
+        return
+    runCommand(sys.argv[1:])
+
+def buildParser():
+    """Return the argument parser of a parse/correlate command line."""
     parser = argparse.ArgumentParser(description="Wrapper script to run odl.py or RBCmd.exe")
     parser.add_argument('-t', '--tool', metavar=('tool1', 'tool2'), nargs='*', help='Specify which tool to run: odl (odl.py), rb (RBCmd.exe)', choices=['odl','rb'])
-    parser.add_argument('-p', '--path', metavar=('path1', 'path2'), nargs='*', help='Path to .odl logs folder for odl or user SID for rb')
+    parser.add_argument('-p', '--path', metavar=('path1', 'path2'), nargs='*', help='Path to .odl logs folder for odl, user SID or Recycle Bin SID folder for rb')
     parser.add_argument('-o', '--output_path', help='Path to output')
     parser.add_argument('-s', '--obfstrmap', help='Path to ObfuscationStringMap.txt (if not in odl_folder)')
     parser.add_argument('-k', '--all_key_values', action='store_true', help='For repeated keys in ObfuscationMap, get all values | delimited (off by default)')
     parser.add_argument('-d', '--all_data', action='store_true', help='Show all data (off by default)')
     parser.add_argument('-c', '--check', action='store_true', help='Run the concurrency check of both tools')
-    args = parser.parse_args()
+    parser.add_argument('--tolerance', type=float, default=CORRELATION_TOLERANCE, help=f'Seconds between an ODL event and the Recycle Bin deletion time to correlate them (default {CORRELATION_TOLERANCE})')
+    parser.add_argument('-f', '--format', choices=['xlsx', 'csv', 'parquet', 'feather'], default='xlsx', help='Output format of the parsed results (default xlsx)')
+    parser.add_argument('-x', '--xlsx', action='store_true', help='With --format other than xlsx, also write the Parsed_concurrency.xlsx workbook')
+    parser.add_argument('--subprocess', action='store_true', help='Run odl.py and RBCmd.exe as separate processes instead of in-process')
+    parser.add_argument('-m', '--max_memory', '--max-memory', type=int, metavar='MB', help='(ODL only) Parse in chunks of about this much memory, sorting through runs on disk')
+    parser.add_argument('--cache', metavar='DIR', help='(ODL only) Reuse the rows of ODL files parsed before, kept decrypted in DIR/parsecache.sqlite (off by default, use a folder of the case)')
+    parser.add_argument('--index_dir', metavar='DIR', help='(ODL only) Compile ObfuscationStringMap into an index in DIR, reused by later runs (off by default, use a folder of the case)')
+    parser.add_argument('--db', help='Also append the parsed rows to this SQLite result store, see the query command (not with -m for ODL)')
+    parser.add_argument('--metrics', help='Time each stage and save the timings to this JSON file')
+    parser.add_argument('--profile', help='Run under cProfile (tools one after the other) and save the profile to this file')
+    parser.add_argument('-b', '--batch', help='Manifest file of evidence roots (user profiles, mounted images), one per line')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='(batch only) Number of parallel jobs (default CPU count)')
+    parser.add_argument('--retries', type=int, default=1, help='(batch only) Times a failed job is retried (default 1)')
+    return parser
+
+def runCommand(argv, pools=None):
+    """Running one parse/correlate command line, returns its output folder. pools keeps batch pools warm, see serve."""
+    parser = buildParser()
+    args = parser.parse_args(argv)
+    stage_stats.clear()
+    if odl:
+        odl.parse_stats.clear()
 
     tools = args.tool
     paths = args.path
+    if args.max_memory and args.db and 'odl' in (tools or ['odl']):
+        # Chunked mode only keeps the records that name a file, the rest are in Parsed_odl on disk
+        parser.error('--db stores all parsed ODL rows, which -m/--max_memory does not keep, run them without -m.')
     output_path = args.output_path or defaultpath()
     output_path = make_unique_folder(output_path, 'Output')
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    start_time = time.perf_counter()
+    if args.metrics and odl:
+        odl.enable_timings()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if args.batch:
+        options = [args.obfstrmap, args.all_key_values, args.all_data, args.subprocess, args.format, max_memory, args.cache, args.index_dir]
+        jobs = discoverJobs(readManifest(args.batch), tools or ['odl', 'rb'], output_path, options)
+        for job in jobs:
+            job['metrics'] = bool(args.metrics)
+        frames = runBatch(jobs, max(args.jobs, 1), args.retries, args.check, args.db, pools)
+        for root, root_frames in frames.items():
+            if 'odl' in root_frames and 'rb' in root_frames:
+                checkConcurrencies(root, args.format, args.xlsx, pd.concat(root_frames['odl'], ignore_index=True),
+                                   pd.concat(root_frames['rb'], ignore_index=True), None, args.tolerance, bool(max_memory))
+        finishRun(args, start_time, profiler)
+        return output_path
+
+    if not tools or not paths:
+        parser.error('--tool and --path are required without --batch.')
     if not len(tools) == len(paths):
         parser.error('Both --tools and --paths must be provided with the same number of values.')
 
+    writer = ThreadPoolExecutor(max_workers=2)
     arguments = []
     for tool, path in zip(tools, paths):
-        arguments.append([tool, path, output_path, args.obfstrmap, args.all_key_values, args.all_data])
+        arguments.append([tool, path, output_path, args.obfstrmap, args.all_key_values, args.all_data, args.subprocess, args.format, max_memory, args.cache, args.index_dir, writer])
 
+    # Parsed DataFrames go straight to the concurrency check, while the writer
+    # executor writes each output file once in the background
+    frames = {}
     try:
-        with ThreadPoolExecutor() as executor:
-            list(tqdm(executor.map(runTool, arguments), total=len(arguments), desc="Processing files"))
+        if profiler:
+            # cProfile only sees the thread it was enabled in
+            results = [runTool(argument) for argument in tqdm(arguments, desc="Processing files")]
+        else:
+            with ThreadPoolExecutor() as executor:
+                results = list(tqdm(executor.map(runTool, arguments), total=len(arguments), desc="Processing files"))
+        for tool, path, df in zip(tools, paths, results):
+            if df is not None:
+                frames[tool] = df
+                if args.db:
+                    storeResults(args.db, tool, path, df)
     except Exception as e:
         print(f"An error occurred: {e}")
 
-    if args.check: checkConcurrencies(output_path)
+    if args.check: checkConcurrencies(output_path, args.format, args.xlsx, frames.get('odl'), frames.get('rb'), writer, args.tolerance, bool(max_memory))
+    writer.shutdown(wait=True)
+    finishRun(args, start_time, profiler)
+    return output_path
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+odl.py parser benchmarks
+------------------------
+Measures the throughput of process_odl, extract_strings, tokenized_replace,
+decrypt and decrypt_batch individually, on a synthetic corpus (see synth_odl.py) so that
+it can run on any plain Linux box without real evidence. extract_strings is
+also compared with the regex scanner it replaced, for speed and output.
+
+Results can be saved with --json and later runs compared against them with
+--compare, which exits with status 1 if any benchmark got slower than the
+tolerance allows.
+
+Usage   : bench_odl.py [-c CORPUS_FOLDER] [-f FILES] [-r RECORDS] [--repeat N]
+                       [--json RESULTS] [--compare BASELINE] [--tolerance 0.2]
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+import odl
+import synth_odl
+
+def read_stream(path):
+    '''Returns (odl_version, CDEF stream bytes) of a file, decompressed if needed'''
+    with open(path, 'rb') as f:
+        odl_version = odl.parse_odl_header(f.read(0x100)).odl_version
+        data = f.read()
+    if data[0:4] == b'\x1F\x8B\x08\x00':
+        data = zlib.decompressobj(31).decompress(data)
+    return odl_version, data
+
+def collect_params(paths):
+    '''Returns the raw parameter blobs of every record in paths'''
+    all_params = []
+    for path in paths:
+        odl_version, data = read_stream(path)
+        pos = 0
+        while pos + 56 <= len(data):
+            header = odl.parse_cdef_header(data, pos, odl_version)
+            data_len = header.data_len - 24 if odl_version == 3 else header.data_len
+            record = data[pos + 56:pos + 56 + data_len]
+            data_pos = odl.read_string(record)[0] + 4
+            data_pos += odl.read_string(record, data_pos)[0]
+            all_params.append(record[data_pos:])
+            pos += 56 + data_len
+    return all_params
+
+def extract_strings_regex(data, map, unobfuscate=True):
+    '''extract_strings() before the length prefix scanner, without its prints'''
+    extracted = []
+    for match in odl.ascii_chars_re.finditer(data):
+        text = match.group()
+        if match.start() >= 4:
+            match_len = match.end() - match.start()
+            stored_len = struct.unpack('<I', data[match.start() - 4 : match.start()])[0]
+            if match_len - stored_len <= 5:
+                x = text[0:stored_len].decode('utf8', 'ignore')
+                x = x.rstrip('\n').rstrip('\r')
+                if unobfuscate:
+                    x = odl.tokenized_replace(x, map)
+                extracted.append(x)
+    if len(extracted) == 0:
+        extracted = ''
+    elif len(extracted) == 1:
+        extracted = extracted[0]
+    return extracted
+
+def measure(name, func, repeat, size, items):
+    '''Runs func repeat times, returns the result of the fastest run'''
+    best = None
+    for _ in range(repeat):
+        odl.decrypt_cache.clear()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    result = {'name': name, 'seconds': best, 'bytes': size, 'items': items,
+              'mb_per_s': size / best / 1e6, 'items_per_s': items / best}
+    print(f"{name:<28} {best:>9.3f} {result['mb_per_s']:>10.2f} {result['items_per_s']:>14,.0f}")
+    return result
+
+def run_benchmarks(corpus_folder, repeat):
+    odl.read_keystore(os.path.join(corpus_folder, 'general.keystore'))
+    map = odl.read_obfuscation_map(os.path.join(corpus_folder, 'ObfuscationStringMap.txt'), False)
+    paths = sorted(os.path.join(corpus_folder, name) for name in os.listdir(corpus_folder)
+                   if name.endswith(('.odl', '.odlgz')))
+    plain_paths = [path for path in paths if path.endswith('.odl')]
+    gzip_paths = [path for path in paths if path.endswith('.odlgz')]
+
+    all_params = collect_params(paths)
+    strings = []
+    for params in all_params:
+        extracted = odl.extract_strings(params, map, False)
+        strings.extend([extracted] if isinstance(extracted, str) else extracted)
+    words = [word for string in strings for word in odl.tokens_re.split(string)[::2] if odl.may_be_encrypted(word)]
+    records = len(all_params)
+
+    print(f'{len(paths)} files, {records} records, {len(strings)} strings, {len(words)} encrypted words')
+    print(f"{'benchmark':<28} {'seconds':>9} {'MB/s':>10} {'items/s':>14}")
+    results = []
+    for name, bench_paths in (('process_odl (odl)', plain_paths), ('process_odl (odlgz)', gzip_paths)):
+        if bench_paths:
+            count = len(collect_params(bench_paths))
+            size = sum(os.path.getsize(path) for path in bench_paths)
+            results.append(measure(name, lambda: [list(odl.process_odl(path, map, True)) for path in bench_paths],
+                                   repeat, size, count))
+    results.append(measure('extract_strings', lambda: [odl.extract_strings(params, map) for params in all_params],
+                           repeat, sum(len(params) for params in all_params), records))
+    results.append(measure('extract_strings (regex)', lambda: [extract_strings_regex(params, map) for params in all_params],
+                           repeat, sum(len(params) for params in all_params), records))
+    different = sum(odl.extract_strings(params, map, False) != extract_strings_regex(params, map, False) for params in all_params)
+    print(f'extract_strings output differs from the regex scanner for {different} of {records} records')
+    results.append(measure('tokenized_replace', lambda: [odl.tokenized_replace(string, map) for string in strings],
+                           repeat, sum(len(string) for string in strings), len(strings)))
+    results.append(measure('decrypt (uncached)', lambda: [odl.decrypt_uncached(word) for word in words],
+                           repeat, sum(len(word) for word in words), len(words)))
+    results.append(measure('decrypt', lambda: [odl.decrypt(word) for word in words],
+                           repeat, sum(len(word) for word in words), len(words)))
+    unique_words = list(dict.fromkeys(words))
+    results.append(measure('decrypt_batch', lambda: odl.decrypt_batch(unique_words),
+                           repeat, sum(len(word) for word in unique_words), len(unique_words)))
+    plain = odl.decrypt_batch(unique_words)
+    different = sum(plain[word] != odl.decrypt_uncached(word) for word in unique_words)
+    print(f'decrypt_batch output differs from decrypt for {different} of {len(unique_words)} distinct words')
+    return results
+
+def compare_results(results, baseline_path, tolerance):
+    '''Prints the change against a saved run, returns False on any regression'''
+    with open(baseline_path, 'r', encoding='utf8') as f:
+        baseline = {result['name']: result for result in json.load(f)['results']}
+    ok = True
+    for result in results:
+        old = baseline.get(result['name'])
+        if not old:
+            continue
+        change = result['items_per_s'] / old['items_per_s'] - 1
+        regressed = change < -tolerance
+        ok = ok and not regressed
+        print(f"{result['name']:<28} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='odl.py parser benchmarks')
+    parser.add_argument('-c', '--corpus', help='Existing corpus folder (default: generate one in a temp folder)')
+    parser.add_argument('-f', '--files', type=int, default=4, help='Files to generate (default 4)')
+    parser.add_argument('-r', '--records', type=int, default=20000, help='Records per generated file (default 20000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark, the fastest is reported (default 3)')
+    parser.add_argument('--json', help='Save results to this file')
+    parser.add_argument('--compare', help='Compare against results saved with --json')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown for --compare (default 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        corpus_folder = args.corpus
+        if not corpus_folder:
+            corpus_folder = temp_folder
+            synth_odl.make_corpus(corpus_folder, args.files, args.records)
+        results = run_benchmarks(corpus_folder, args.repeat)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf8') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=1)
+    if args.compare and not compare_results(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+RBODLcmd.py DataFrame benchmarks
+--------------------------------
+Measures the ODL column transforms of parseOdl on a synthetic DataFrame of
+millions of rows, against the previous per-row string implementation,
+and checks that both give the same values.
+
+Usage   : bench_parse.py [-n ROWS] [--functions N] [--repeat N] [--json RESULTS]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import RBODLcmd
+import synth_odl
+
+def make_frame(rows, functions=300, seed=0):
+    '''ODL DataFrame as odl.py writes it, with string timestamps'''
+    rng = np.random.default_rng(seed)
+    names = random.Random(seed)
+    function_names = [f"{names.choice(('Sync', 'File', 'Cache', 'Log'))}Engine::{names.choice(('Process', 'Handle', 'Find'))}Change{index}"
+                      for index in range(functions)]
+    code_files = [code_file for code_file, _ in synth_odl.CODE_FUNCTIONS]
+    log_files = [f'SyncEngine-{index:04}.odl' for index in range(20)]
+    start = datetime.datetime(2023, 11, 14)
+    ms = np.sort(rng.integers(0, 86400000 * 30, rows))
+    return pd.DataFrame({
+        'Filename': np.array(log_files, dtype=object)[rng.integers(0, len(log_files), rows)],
+        'File_Index': np.arange(rows),
+        'Timestamp': [str(start + datetime.timedelta(milliseconds=int(value))) for value in ms],
+        'Code_File': np.array(code_files, dtype=object)[rng.integers(0, len(code_files), rows)],
+        'Function': np.array(function_names, dtype=object)[rng.integers(0, functions, rows)],
+        'Params_Decoded': np.array(['status=1', "fileName: 'C:\\Users\\bob\\Documents\\desktop.ini']", ''], dtype=object)[rng.integers(0, 3, rows)],
+    })
+
+def transform_per_row(df_odl, path):
+    '''The parseOdl transforms before they were dictionary encoded'''
+    df_odl.drop(['File_Index'], axis=1, inplace=True)
+    df_odl['Filename'] = df_odl['Filename'].apply(lambda x: os.path.join(path, x))
+    df_odl['Timestamp'] = df_odl['Timestamp'].str.split('.').str[0]
+    df_odl['Function'] = df_odl['Function'].str.replace(r'(?<!^)(?=[A-Z])',' ', regex=True).str.replace('::',' -')
+    df_odl = RBODLcmd.move_column_to_first(df_odl, 'Timestamp')
+    return df_odl.sort_values(by='Timestamp', ascending=False)
+
+def measure(name, func, df, repeat):
+    '''Runs func on copies of df repeat times, returns (result, fastest run)'''
+    best = None
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        result_df = func(frame, 'C:\\logs')
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    result = {'name': name, 'seconds': best, 'rows': len(df), 'rows_per_s': len(df) / best,
+              'memory_mb': result_df.memory_usage(deep=True).sum() / 1e6}
+    print(f"{name:<20} {best:>9.3f} {result['rows_per_s']:>14,.0f} {result['memory_mb']:>10.1f}")
+    return result_df, result
+
+def same_values(old, new):
+    '''True if both transforms give the same values for every row'''
+    old = old.sort_index()
+    new = new.sort_index()
+    new_timestamps = new['Timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return all(np.array_equal(old[column].to_numpy(dtype=object), values.to_numpy(dtype=object))
+               for column, values in (('Filename', new['Filename']), ('Function', new['Function']),
+                                      ('Timestamp', new_timestamps)))
+
+def main():
+    parser = argparse.ArgumentParser(description='RBODLcmd.py DataFrame benchmarks')
+    parser.add_argument('-n', '--rows', type=int, default=2000000, help='Rows in the DataFrame (default 2000000)')
+    parser.add_argument('--functions', type=int, default=300, help='Distinct function names (default 300)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark, the fastest is reported (default 3)')
+    parser.add_argument('--json', help='Save results to this file')
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.functions)
+    print(f"{len(df):,} rows, {df['Function'].nunique()} functions")
+    print(f"{'benchmark':<20} {'seconds':>9} {'rows/s':>14} {'memory MB':>10}")
+    old, old_result = measure('parseOdl (per row)', transform_per_row, df, args.repeat)
+    new, new_result = measure('parseOdl', RBODLcmd.transformOdl, df, args.repeat)
+    print(f"Speedup {old_result['seconds'] / new_result['seconds']:.1f}x, same values: {same_values(old, new)}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf8') as f:
+            json.dump({'python': sys.version.split()[0], 'pandas': pd.__version__,
+                       'results': [old_result, new_result]}, f, indent=1)
+
+if __name__ == "__main__":
+    main()
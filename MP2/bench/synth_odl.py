@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Synthetic OneDrive ODL corpus generator
+---------------------------------------
+Writes realistic, shareable .odl / .odlgz files for testing and
+benchmarking odl.py without real evidence. Files have the EBFGONED
+file header and version 2 or version 3 CDEF record headers, gzip
+variants are written as .odlgz. Path and user name parameters are AES
+encrypted the way OneDrive does it, with a matching general.keystore,
+and an ObfuscationStringMap.txt is written alongside.
+
+Usage   : synth_odl.py [-f FILES] [-r RECORDS] [-z GZIP_FILES] [--seed SEED] output_folder
+
+Requires python3.7+ and pycryptodome
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import struct
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+CODE_FUNCTIONS = (
+    ('SyncEngine.cpp', 'ProcessChange'),
+    ('SyncEngine.cpp', 'OnFileAction'),
+    ('FileSystemWatcher.cpp', 'HandleNotification'),
+    ('LocalChangeEnumerator.cpp', 'EnumerateChanges'),
+    ('cache.cpp', 'Find'),
+    ('AclHelper.cpp', 'RecordCallTimeTaken'),
+    ('EventMachine.cpp', 'FireEvent'),
+    ('LogUploader2.cpp', 'UploadLogs'),
+    ('SyncTelemetry.cpp', 'RecordTelemetry'),
+    ('ServiceUtil.cpp', 'GetDriveInfo'),
+)
+USER_NAMES = ('alice', 'bob', 'carol', 'student', 'Administrator')
+FOLDER_NAMES = ('Documents', 'Desktop', 'Pictures', 'Projects', 'Finance 2023', 'Données')
+FILE_NAMES = ('Report.docx', 'Budget.xlsx', 'desktop.ini', 'notes.txt', 'Document.docx', 'photo_0001.jpg')
+FILE_ACTIONS = ('FILE_ACTION_ADDED', 'FILE_ACTION_MODIFIED', 'FILE_ACTION_REMOVED', 'FILE_ACTION_RENAMED_NEW_NAME')
+
+def encrypt(key, text):
+    '''Encrypts text the way OneDrive obfuscates it, AES-CBC with zero IV over
+       UTF-16LE, url safe base64 without padding'''
+    cipher = AES.new(key, AES.MODE_CBC, iv=b'\0'*16)
+    data = cipher.encrypt(pad(text.encode('utf-16le'), 16))
+    return base64.b64encode(data).decode('ascii').replace('/', '_').replace('+', '-').rstrip('=')
+
+def pack_string(text):
+    '''Length prefixed UTF8 string, as stored in the record data'''
+    data = text.encode('utf8')
+    return struct.pack('<I', len(data)) + data
+
+def file_header(odl_version):
+    '''The 0x100 byte EBFGONED file header'''
+    return (b'EBFGONED' + struct.pack('<IIQI', odl_version, 0, 0, 0) +
+            b'23.226.1031.0003'.ljust(0x40, b'\0') + b'10.0.19045'.ljust(0x40, b'\0') + b'\0' * 0x64)
+
+def cdef_record(odl_version, timestamp, code_file, function, params):
+    '''One CDEF record, 56 byte header followed by the data'''
+    data = pack_string(code_file) + struct.pack('<I', 0) + pack_string(function) + params
+    if odl_version == 2:
+        header = struct.pack('<QQII20sIII', 0xFFEEDDCC, timestamp, 0, 0, b'\0' * 20, 1, len(data), 0)
+    else: # data_len includes 24 more bytes in v3
+        header = struct.pack('<QQIII16sI', 0xFFEEDDCC, timestamp, 0, 0, len(data) + 24, b'\0' * 16, 1) + b'\0' * 8
+    return header + data
+
+def random_params(rng, key):
+    '''Parameter blob of length prefixed strings mixed with integers'''
+    params = []
+    for _ in range(rng.randrange(0, 5)):
+        choice = rng.random()
+        if choice < 0.35:
+            path = '\\'.join(encrypt(key, name) for name in (rng.choice(USER_NAMES), rng.choice(FOLDER_NAMES)))
+            params.append(pack_string(f"fileName: 'C:\\Users\\{path}\\{rng.choice(FILE_NAMES)}']"))
+        elif choice < 0.5:
+            # the name is split off by a token, as in real logs, so it decrypts
+            action = rng.choice(FILE_ACTIONS)
+            path = '\\'.join(encrypt(key, name) for name in (rng.choice(USER_NAMES), rng.choice(FILE_NAMES)))
+            params.append(pack_string(f"{action}: 'C:\\Users\\{path}']"))
+        elif choice < 0.75:
+            params.append(struct.pack('<I', rng.randrange(1 << 24)))
+        else:
+            params.append(pack_string(f'status={rng.randrange(100)} resourceId={rng.getrandbits(64):016X}'))
+    return b''.join(params)
+
+def write_keystore(folder, key):
+    path = os.path.join(folder, 'general.keystore')
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump([{'Key': base64.b64encode(key).decode('ascii'), 'Version': 1}], f)
+    return path
+
+def write_obfuscation_map(folder, rng, count):
+    '''ObfuscationStringMap.txt in UTF-16LE, with some repeated keys'''
+    path = os.path.join(folder, 'ObfuscationStringMap.txt')
+    lines = []
+    for index in range(count):
+        lines.append(f'{rng.getrandbits(48):012x}\t{rng.choice(FOLDER_NAMES)}{index}')
+        if index % 50 == 0 and lines:
+            lines.append(lines[rng.randrange(len(lines))].split('\t')[0] + '\tolder value')
+    with open(path, 'w', encoding='utf-16le', newline='\n') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
+
+def make_corpus(folder, files=4, records=5000, gzip_files=1, map_items=1000, seed=0):
+    '''Writes a corpus to folder, returns the list of ODL file paths'''
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    key = bytes(rng.getrandbits(8) for _ in range(32))
+    write_keystore(folder, key)
+    write_obfuscation_map(folder, rng, map_items)
+    timestamp = 1700000000000
+    paths = []
+    for index in range(files):
+        odl_version = 2 if index % 2 == 0 else 3
+        body = []
+        for _ in range(records):
+            timestamp += rng.randrange(1, 2000)
+            code_file, function = rng.choice(CODE_FUNCTIONS)
+            body.append(cdef_record(odl_version, timestamp, code_file, function, random_params(rng, key)))
+        body = b''.join(body)
+        if index >= files - gzip_files:
+            path = os.path.join(folder, f'SyncEngine-{index:04}.odlgz')
+            body = gzip.compress(body)
+        else:
+            path = os.path.join(folder, f'SyncEngine-{index:04}.odl')
+        with open(path, 'wb') as f:
+            f.write(file_header(odl_version) + body)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic OneDrive ODL corpus generator')
+    parser.add_argument('output_folder', help='Folder to write the corpus to')
+    parser.add_argument('-f', '--files', type=int, default=4, help='Number of ODL files (default 4)')
+    parser.add_argument('-r', '--records', type=int, default=5000, help='Records per file (default 5000)')
+    parser.add_argument('-z', '--gzip_files', type=int, default=1, help='How many of the files are .odlgz (default 1)')
+    parser.add_argument('-m', '--map_items', type=int, default=1000, help='Items in ObfuscationStringMap.txt (default 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same corpus')
+    args = parser.parse_args()
+
+    paths = make_corpus(args.output_folder, args.files, args.records, args.gzip_files, args.map_items, args.seed)
+    size = sum(os.path.getsize(path) for path in paths)
+    print(f'Wrote {len(paths)} files, {args.files * args.records} records, {size / 1e6:.1f} MB to {args.output_folder}')
+
+if __name__ == "__main__":
+    main()
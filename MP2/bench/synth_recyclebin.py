@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Synthetic Recycle Bin generator
+-------------------------------
+Writes $I (and empty $R) files in both the version 1 and version 2
+formats to a folder named like a user SID, for testing the Recycle Bin
+parsing and the ODL correlation without real evidence. File names are
+the same ones synth_odl.py uses in FILE_ACTION_REMOVED events.
+
+Usage   : synth_recyclebin.py [-n COUNT] [--seed SEED] output_folder
+"""
+
+import argparse
+import os
+import random
+import struct
+import string
+
+import synth_odl
+
+def i_file(version, file_size, deleted_on_ms, original_path):
+    '''Contents of a $I file, deleted_on_ms is a unix millisecond timestamp'''
+    filetime = (deleted_on_ms + 11644473600000) * 10000
+    name = original_path.encode('utf-16le')
+    header = struct.pack('<qqq', version, file_size, filetime)
+    if version == 1:
+        return header + name.ljust(520, b'\0')[:520]
+    return header + struct.pack('<I', len(original_path) + 1) + name + b'\0\0'
+
+def make_recycle_bin(folder, count=50, seed=0, start_ms=1700000000000):
+    '''Writes count deleted items to folder, returns the $I file paths'''
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    deleted_on_ms = start_ms
+    for index in range(count):
+        deleted_on_ms += rng.randrange(1000, 600000)
+        suffix = ''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(6))
+        file_name = rng.choice(synth_odl.FILE_NAMES)
+        original_path = f'C:\\Users\\{rng.choice(synth_odl.USER_NAMES)}\\{rng.choice(synth_odl.FOLDER_NAMES)}\\{file_name}'
+        version = 1 if index % 4 == 0 else 2
+        path = os.path.join(folder, f'$I{suffix}{os.path.splitext(file_name)[1]}')
+        with open(path, 'wb') as f:
+            f.write(i_file(version, rng.randrange(1, 1 << 24), deleted_on_ms, original_path))
+        open(os.path.join(folder, f'$R{suffix}{os.path.splitext(file_name)[1]}'), 'wb').close()
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic Recycle Bin generator')
+    parser.add_argument('output_folder', help='Folder to write to, e.g. .../S-1-5-21-1000-1000-1000-1001')
+    parser.add_argument('-n', '--count', type=int, default=50, help='Number of deleted items (default 50)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same files')
+    args = parser.parse_args()
+
+    paths = make_recycle_bin(args.output_folder, args.count, args.seed)
+    print(f'Wrote {len(paths)} $I files to {args.output_folder}')
+
+if __name__ == "__main__":
+    main()
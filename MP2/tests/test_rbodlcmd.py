@@ -0,0 +1,27 @@
+"""
+RBODLcmd.py pipeline tests, run with: python -m pytest MP2/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import RBODLcmd
+
+ODL_OUTPUT_COLUMNS = ['Timestamp', 'Filename', 'Code_File', 'Function', 'Params_Decoded']
+
+@pytest.mark.parametrize('max_memory', [None, 5 * 1024 * 1024])
+def test_empty_odl_folder(tmp_path, max_memory):
+    '''An ODL folder without records still gives an empty Parsed_odl output and frame'''
+    odl_folder = tmp_path / 'logs'
+    odl_folder.mkdir()
+    output_path = tmp_path / 'Output'
+    output_path.mkdir()
+    df = RBODLcmd.runTool(['odl', str(odl_folder), str(output_path), None, False, False, False, 'csv', max_memory, None, None, None])
+    assert df is not None and df.empty
+    assert list(df.columns) == ODL_OUTPUT_COLUMNS
+    parsed = RBODLcmd.readFrame(str(output_path), 'Parsed_odl', 'csv')
+    assert parsed.empty
+    assert list(parsed.columns) == ODL_OUTPUT_COLUMNS
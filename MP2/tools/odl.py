@@ -18,7 +18,8 @@ On macOS, they will usually be under:
 Author  : Yogesh Khatri, yogesh@swiftforensics.com
 License : MIT
 Version : 1.8, 2024-01-08
-Usage   : odl.py [-o OUTPUT_PATH] [-k] [-d] [-s obfuscationmap.txt] odl_folder
+Usage   : odl.py [-o OUTPUT_PATH] [-k] [-d] [-i] [-j JOBS] [--index_dir DIR] [--cache DIR] [--metrics METRICS.json] [--profile FILE]
+                 [--follow [--interval SECONDS]] [-s obfuscationmap.txt] odl_folder
           odl_folder is the path to folder where .odl and .odlgz
           are stored. OUTPUT_PATH is optional, if not
           specified, output will be saved in odl_folder. When
@@ -30,24 +31,32 @@ Usage   : odl.py [-o OUTPUT_PATH] [-k] [-d] [-s obfuscationmap.txt] odl_folder
           Personal folder and .odl files in other folders use it too. 
           There will be a different general.keystore file in each folder
           that contains a ODL file, which can decrypt those files only,
-          and not ones in other folders.
+          and not ones in other folders. With --follow, odl.py keeps
+          running after that and appends the records OneDrive writes
+          from then on, until stopped with Ctrl+C.
 
 Requires python3.7+ and the construct module
 """
 
 import argparse
 import base64
+import collections
 import csv
 import datetime
 import glob
-import io
+import hashlib
+import itertools
 import json
+import mmap
 import os
 import re
+import sqlite3
 import string
 import struct
+import time
 import zlib
 
+from concurrent.futures import ProcessPoolExecutor
 from construct import *
 from construct.core import Int32ul, Int64ul
 from Crypto.Cipher import AES
@@ -105,19 +114,79 @@ Odl_header = Struct(
     "reserved" / Byte[0x64]
 )
 
+# Precompiled equivalents of the above Structs, these avoid the per call
+# overhead of construct which dominates on logs with millions of records
+CDEF_V2_FAST = struct.Struct('<QQII20sIII') # 56 bytes
+CDEF_V3_FAST = struct.Struct('<QQIII16sI')  # 48 bytes, record header is still 56
+Odl_header_fast = struct.Struct('<8sIIQI64s64s100s')
+
+CdefHeader = collections.namedtuple('CdefHeader', 'signature timestamp data_len')
+OdlHeader = collections.namedtuple('OdlHeader', 'signature odl_version')
+
+header_decoder = 'fast' # fast, construct or validate (both, compared)
+parse_stats = collections.Counter()
+stage_timings = False # set by enable_timings()
+
+def parse_odl_header(data):
+    '''Decode the 0x100 byte file header, returns OdlHeader'''
+    if header_decoder != 'construct':
+        try:
+            fields = Odl_header_fast.unpack_from(data)
+            parse_stats['odl_header_fast'] += 1
+            return OdlHeader(fields[0], fields[1])
+        except struct.error:
+            pass
+    odl_header = Odl_header.parse(data)
+    parse_stats['odl_header_construct'] += 1
+    return OdlHeader(odl_header.signature, odl_header.odl_version)
+
+def parse_cdef_header_construct(data, offset, odl_version):
+    '''Decode a CDEF header with construct, returns CdefHeader'''
+    if odl_version == 2:
+        header = CDEF_V2.parse(data[offset:offset + 56])
+    else:
+        header = CDEF_V3.parse(data[offset:offset + 56])
+    parse_stats['cdef_construct'] += 1
+    return CdefHeader(header.signature, header.timestamp, header.data_len)
+
+def parse_cdef_header(data, offset, odl_version):
+    '''Decode the 56 byte CDEF header at offset in data, returns CdefHeader.
+       odl_version must be 2 or 3. Uses the struct fast path unless
+       header_decoder says otherwise, falling back to construct if the
+       fast path fails.
+    '''
+    if header_decoder == 'construct':
+        return parse_cdef_header_construct(data, offset, odl_version)
+    try:
+        if odl_version == 2:
+            signature, timestamp, _, _, _, _, data_len, _ = CDEF_V2_FAST.unpack_from(data, offset)
+        else:
+            signature, timestamp, _, _, data_len, _, _ = CDEF_V3_FAST.unpack_from(data, offset)
+    except struct.error:
+        return parse_cdef_header_construct(data, offset, odl_version)
+    parse_stats['cdef_fast'] += 1
+    header = CdefHeader(signature, timestamp, data_len)
+    if header_decoder == 'validate':
+        expected = parse_cdef_header_construct(data, offset, odl_version)
+        if header != expected:
+            parse_stats['cdef_mismatch'] += 1
+            print(f'Header decoder mismatch at offset {offset}: fast={header} construct={expected}')
+    return header
+
 def is_file_empty(file_path):
     '''Check if file is empty by confirming if its size is 0 bytes'''
     return os.path.exists(file_path) and os.stat(file_path).st_size == 0
 
-def read_string(data):
-    '''read string, return tuple (bytes_consumed, string)'''
-    if (len(data)) >= 4:
-        str_len = struct.unpack('<I', data[0:4])[0]
+def read_string(data, pos=0):
+    '''read string at pos, return tuple (bytes_consumed, string). data may
+       be a memoryview, only the string itself is copied out of it'''
+    if (len(data) - pos) >= 4:
+        str_len = struct.unpack_from('<I', data, pos)[0]
         if str_len:
-            if str_len > len(data):
+            if str_len > len(data) - pos:
                 print("Error in read_string()")
             else:
-                return (4 + str_len, data[4:4 + str_len].decode('utf8', 'ignore'))
+                return (4 + str_len, str(data[pos + 4:pos + 4 + str_len], 'utf8', 'ignore'))
     return (4, '')
 
 def guess_encoding(obfuscation_map_path):
@@ -136,73 +205,229 @@ def guess_encoding(obfuscation_map_path):
 key = ''
 utf_type = 'utf16'
 
-def decrypt(cipher_text):
-    '''cipher_text is expected to be base64 encoded'''
-    global key
-    global utf_type
+DECRYPT_CACHE_SIZE = 0x10000
 
-    cipher_text_orig = cipher_text
-    
+class LRUCache:
+    '''Bounded dict, evicts the least recently used item when full'''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+
+    def get(self, item_key, default=None):
+        try:
+            value = self.items[item_key]
+        except KeyError:
+            return default
+        self.items.move_to_end(item_key)
+        return value
+
+    def put(self, item_key, value):
+        self.items[item_key] = value
+        self.items.move_to_end(item_key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+# Memo of (key, cipher_text) -> plain_text, failures map to cipher_text itself.
+# Including the key scopes the entries to the keystore they were made with.
+decrypt_cache = LRUCache(DECRYPT_CACHE_SIZE)
+aes_ecb = None
+aes_ecb_key = None
+
+def ecb_cipher():
+    '''Returns the reusable AES-ECB cipher object of the current key'''
+    global aes_ecb
+    global aes_ecb_key
+    if aes_ecb is None or aes_ecb_key is not key:
+        aes_ecb = AES.new(key, AES.MODE_ECB)
+        aes_ecb_key = key
+    return aes_ecb
+
+def aes_cbc_decrypt(cipher_text):
+    '''AES-CBC decrypt with a zero IV, using one reusable ECB cipher object
+       per key. In CBC, each plain block is the decrypted block XOR'd with
+       the previous cipher block (the IV for the first block).
+    '''
+    raw = ecb_cipher().decrypt(cipher_text)
+    previous = b'\0'*16 + cipher_text[:-16]
+    return (int.from_bytes(raw, 'little') ^ int.from_bytes(previous, 'little')).to_bytes(len(raw), 'little')
+
+def decrypt(cipher_text):
+    '''cipher_text is expected to be base64 encoded. Results are memoised
+       per key, including words that were not encrypted (returned as is)
+    '''
     if key == '':
-        return cipher_text_orig
+        return cipher_text
+    cache_key = (key, cipher_text)
+    plain_text = decrypt_cache.get(cache_key)
+    if plain_text is None:
+        parse_stats['decrypt_cache_misses'] += 1
+        plain_text = decrypt_uncached(cipher_text)
+        decrypt_cache.put(cache_key, plain_text)
+    else:
+        parse_stats['decrypt_cache_hits'] += 1
+    return plain_text
+
+def decode_cipher_text(cipher_text):
+    '''Returns the bytes of a base64 encoded cipher text, None if it is 
+       not one (invalid, or it was not encrypted)'''
     if len(cipher_text) < 22:
-        return cipher_text_orig # invalid or it was not encrypted!
+        return None
     # add proper base64 padding
     remainder = len(cipher_text) % 4
     if remainder == 1:
-        return cipher_text_orig # invalid b64 or it was not encrypted!
+        return None
     elif remainder in (2, 3):
         cipher_text += "="* (4 - remainder)
     try:
         cipher_text = cipher_text.replace('_', '/').replace('-', '+')
         cipher_text = base64.b64decode(cipher_text)
     except:
-        return cipher_text_orig
-    
+        return None
     if len(cipher_text) % 16 != 0:
-        return cipher_text_orig
+        return None
+    return cipher_text
 
+def plain_text_of(raw, cipher_text_orig):
+    '''Returns the unpadded, decoded text of decrypted bytes, or 
+       cipher_text_orig if they are not valid'''
     try:
-        cipher = AES.new(key, AES.MODE_CBC, iv=b'\0'*16)
-        raw = cipher.decrypt(cipher_text)
+        plain_text = unpad(raw, 16)
     except ValueError as ex:
-        print('Exception while decrypting data', str(ex))
         return cipher_text_orig
     try:
-        plain_text = unpad(raw, 16)
+        return plain_text.decode(utf_type)
     except ValueError as ex:
-        #print("Error in unpad!", str(ex), raw)
         return cipher_text_orig
+
+def decrypt_uncached(cipher_text):
+    '''cipher_text is expected to be base64 encoded'''
+    if key == '':
+        return cipher_text
+    data = decode_cipher_text(cipher_text)
+    if data is None:
+        return cipher_text
     try:
-        plain_text = plain_text.decode(utf_type)#, 'ignore')
+        raw = aes_cbc_decrypt(data)
     except ValueError as ex:
-        #print(f"Error decoding {utf_type}", str(ex))
-        return cipher_text_orig
-    return plain_text
+        print('Exception while decrypting data', str(ex))
+        return cipher_text
+    return plain_text_of(raw, cipher_text)
+
+def decrypt_batch(words):
+    '''Returns {word: decrypt(word)} for distinct words. The ones not in 
+       decrypt_cache are decrypted together, all their blocks in one ECB 
+       pass, then XOR'd at once with the blocks before them (zero for the
+       first block of each word), which is CBC with a zero IV per word.
+    '''
+    if key == '':
+        return {word: word for word in words}
+    plain = {}
+    misses = []
+    pending = []
+    for word in words:
+        plain_text = decrypt_cache.get((key, word))
+        if plain_text is not None:
+            parse_stats['decrypt_cache_hits'] += 1
+            plain[word] = plain_text
+            continue
+        parse_stats['decrypt_cache_misses'] += 1
+        misses.append(word)
+        data = decode_cipher_text(word)
+        if data is None:
+            plain[word] = word
+        else:
+            pending.append((word, data))
+    if pending:
+        cipher_text = b''.join(data for _, data in pending)
+        previous = b''.join((b'\0'*16 + data)[:len(data)] for _, data in pending)
+        try:
+            raw = ecb_cipher().decrypt(cipher_text)
+        except ValueError:
+            raw = None # same errors as the one by one path
+        if raw is None:
+            for word, _ in pending:
+                plain[word] = decrypt_uncached(word)
+        else:
+            raw = (int.from_bytes(raw, 'little') ^ int.from_bytes(previous, 'little')).to_bytes(len(raw), 'little')
+            pos = 0
+            for word, data in pending:
+                plain[word] = plain_text_of(raw[pos:pos + len(data)], word)
+                pos += len(data)
+    for word in misses:
+        decrypt_cache.put((key, word), plain[word])
+    return plain
+
+LOADED_FILES_SIZE = 16
+
+# Maps and keystores this process already read, by path, size and mtime, so
+# a long running process (RBODLcmd.py serve) reads each of them only once
+loaded_files = LRUCache(LOADED_FILES_SIZE)
+
+def load_once(path, options, load):
+    '''Returns load(), memoised by path, options and the file's size and mtime'''
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, options)
+    value = loaded_files.get(memo_key)
+    if value is None:
+        value = load()
+        loaded_files.put(memo_key, value)
+    return value
+
+def create_private_file(path):
+    '''Creates an empty file at path (and its folder) readable by this user
+       only, for files that hold evidence derived text'''
+    os.makedirs(os.path.dirname(path) or '.', mode=0o700, exist_ok=True)
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+
+def file_sha256(path):
+    '''Returns the hex sha256 of a file's contents'''
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(0x100000), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def parse_keystore(keystore_path):
+    '''Returns (key, version, utf_type) read from a general.keystore file, key
+       is still base64 encoded. Raises ValueError if the JSON is invalid'''
+    encoding = guess_encoding(keystore_path)
+    with open(keystore_path, 'r', encoding=encoding) as f:
+        j = json.load(f)
+        key = j[0]['Key']
+        version = j[0]['Version']
+        utf_type = 'utf32' if key.endswith('\\u0000\\u0000') else 'utf16'
+        return key, version, utf_type
 
 def read_keystore(keystore_path):
+    '''Sets the global key and utf_type from a general.keystore file. The key
+       is only kept in memory, it is never written to an index or cache.'''
     global key
     global utf_type
-    encoding = guess_encoding(keystore_path)
-    with open(keystore_path, 'r', encoding=encoding) as f:
-        try:
-            j = json.load(f)
-            key = j[0]['Key']
-            version = j[0]['Version']
-            utf_type = 'utf32' if key.endswith('\\u0000\\u0000') else 'utf16'
-            print(f"Recovered Unobfuscation key {key}, version={version}, utf_type={utf_type}")
-            key = base64.b64decode(key)
-            if version != 1:
-                print(f'WARNING: Key version {version} is unsupported. This may not work. Contact the author if you see this to add support for this version.')
-        except ValueError as ex:
-            print("JSON error " + str(ex))
+    try:
+        b64_key, version, utf_type = load_once(keystore_path, None, lambda: parse_keystore(keystore_path))
+    except ValueError as ex:
+        print("JSON error " + str(ex))
+        return
+    print(f"Recovered Unobfuscation key {b64_key}, version={version}, utf_type={utf_type}")
+    key = base64.b64decode(b64_key)
+    if version != 1:
+        print(f'WARNING: Key version {version} is unsupported. This may not work. Contact the author if you see this to add support for this version.')
 
-def read_obfuscation_map(obfuscation_map_path, store_all_key_values):
+def parse_obfuscation_map(obfuscation_map_path, store_all_key_values):
+    '''Returns (map, repeated_items_found)'''
     map = {}
     repeated_items_found = False
+    last_val = None
     encoding = guess_encoding(obfuscation_map_path)
     with open(obfuscation_map_path, 'r', encoding=encoding) as f:
-        for line in f.readlines():
+        # values are kept as lists of fragments, and joined once at the end
+        for line in f:
             line = line.rstrip('\n')
             terms = line.split('\t')
             if len(terms) == 2:
@@ -210,87 +435,222 @@ def read_obfuscation_map(obfuscation_map_path, store_all_key_values):
                     repeated_items_found = True
                     if not store_all_key_values:
                         continue # newer items are on top, skip older items found below.
-                    old_val = map[terms[0]]
-                    new_val = f'{old_val}|{terms[1]}'
-                    map[terms[0]] = new_val
-                    last_key = terms[0]
-                    last_val = new_val
+                    last_val = map[terms[0]]
+                    last_val.extend(('|', terms[1]))
                 else:
-                    map[terms[0]] = terms[1]
-                    last_key = terms[0]
-                    last_val = terms[1]
+                    last_val = [terms[1]]
+                    map[terms[0]] = last_val
             else:
                 if terms[0] in map:
                     if not store_all_key_values:
                         continue
-                last_val += '\n' + line
-                map[last_key] = last_val
+                if last_val is not None:
+                    last_val.extend(('\n', line))
                 #print('Error? ' + str(terms))
+    return {k: ''.join(v) for k, v in map.items()}, repeated_items_found
+
+def read_obfuscation_map(obfuscation_map_path, store_all_key_values):
+    map, repeated_items_found = parse_obfuscation_map(obfuscation_map_path, store_all_key_values)
     if repeated_items_found:
         print('WARNING: Multiple instances of some keys were found in the ObfuscationMap.')
     return map
-    
+
+class ObfuscationMapIndex:
+    '''Read only, dict like view of a compiled ObfuscationStringMap index.
+       Words are looked up lazily in sqlite instead of loading the whole
+       map. Pickles as its path, so it can be handed to spawned pool 
+       workers, and forked workers open their own connection on first use.
+    '''
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db = None
+        self.pid = None
+        self.count, self.repeated_items_found = self.connection().execute('SELECT count, repeated FROM meta').fetchone()
+
+    def connection(self):
+        '''Returns the sqlite connection of this process, a connection
+           inherited through fork is not used'''
+        if self.pid != os.getpid():
+            self.db = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+            self.pid = os.getpid()
+        return self.db
+
+    def get(self, word, default=None):
+        row = self.connection().execute('SELECT value FROM map WHERE key = ?', (word,)).fetchone()
+        return default if row is None else row[0]
+
+    def __getitem__(self, word):
+        value = self.get(word)
+        if value is None:
+            raise KeyError(word)
+        return value
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        return self.db_path
+
+    def __setstate__(self, db_path):
+        self.__init__(db_path)
+
+def open_obfuscation_map_index(obfuscation_map_path, store_all_key_values, index_dir):
+    '''Returns an ObfuscationMapIndex for the map file, compiling it into
+       index_dir first if this exact file (by sha256) was not seen before'''
+    sha256 = file_sha256(obfuscation_map_path)
+    mode = 'all' if store_all_key_values else 'latest'
+    db_path = os.path.join(index_dir, f'obfmap-{sha256}-{mode}.sqlite')
+    if not os.path.exists(db_path):
+        print('Compiling ObfuscationStringMap index, later runs will reuse it')
+        map, repeated_items_found = parse_obfuscation_map(obfuscation_map_path, store_all_key_values)
+        temp_path = f'{db_path}.{os.getpid()}.tmp'
+        create_private_file(temp_path)
+        db = sqlite3.connect(temp_path)
+        try:
+            with db:
+                db.execute('CREATE TABLE map (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID')
+                db.execute('CREATE TABLE meta (count INTEGER, repeated INTEGER)')
+                db.executemany('INSERT INTO map VALUES (?, ?)', map.items())
+                db.execute('INSERT INTO meta VALUES (?, ?)', (len(map), int(repeated_items_found)))
+        finally:
+            db.close()
+        os.replace(temp_path, db_path)
+    index = ObfuscationMapIndex(db_path)
+    if index.repeated_items_found:
+        print('WARNING: Multiple instances of some keys were found in the ObfuscationMap.')
+    return index
+
+tokens = ':\\.@%#&*|{}!?<>;:~()//"\''
+# Splitting with a capture group alternates words and tokens, [word, token, word, .., word]
+tokens_re = re.compile('([' + re.escape(tokens) + ']+)')
+# b64decode() discards characters outside the base64 alphabet, so only words
+# with at least 22 alphabet characters (one 16 byte AES block) can decrypt
+not_base64_char_re = re.compile('[^A-Za-z0-9+/_-]')
+
+def may_be_encrypted(word):
+    '''Cheap check, False if decrypt(word) would return word unchanged'''
+    if len(word) < 22 or len(word) % 4 == 1:
+        return False
+    return len(word) - len(not_base64_char_re.findall(word)) >= 22
+
+def split_words(string):
+    '''Returns (parts, indexes), string split into words and tokens, and the
+       indexes of the words in parts that may be encrypted'''
+    if len(string) < 22: # too short to hold an encrypted word
+        return [string], ()
+    parts = tokens_re.split(string)
+    # words are at the even indexes, tokens at the odd ones
+    return parts, [index for index in range(0, len(parts), 2) if may_be_encrypted(parts[index])]
+
+def replace_words(parts, indexes, plain, map):
+    '''Returns parts joined, with the words at indexes replaced by their 
+       decrypted text in plain ({word: decrypt(word)}), or by their value 
+       in map if that is empty'''
+    for index in indexes:
+        word = parts[index]
+        decrypted_word = plain[word]
+        if decrypted_word:
+            parts[index] = decrypted_word
+        elif word in map:
+            parts[index] = map[word]
+    return ''.join(parts)
+
 def tokenized_replace(string, map):
-    output = ''
-    tokens = ':\\.@%#&*|{}!?<>;:~()//"\''
-    parts = [] # [ ('word', 1), (':', 0), ..] word=1, token=0
-    last_word = ''
-    last_token = ''
-    for i, char in enumerate(string):
-        if char in tokens:
-            if last_word:
-                parts.append((last_word, 1))
-                last_word = ''
-            if last_token:
-                last_token += char
-            else:
-                last_token = char
-        else:
-            if last_token:
-                parts.append((last_token, 0))
-                last_token = ''
-            if last_word:
-                last_word += char
-            else:
-                last_word = char
-    if last_token:
-        parts.append((last_token, 0))
-    if last_word:
-        parts.append((last_word, 1))
-    
-    # now join all parts replacing the words
-    for part in parts:
-        if part[1] == 0: # token
-            output += part[0]
-        else: # word
-            word = part[0]
-            decrypted_word = decrypt(word)
-            if decrypted_word:
-                output += decrypted_word
-            elif word in map:
-                output += map[word]
-            else:
-                output += word
-    return output
+    parts, indexes = split_words(string)
+    if not indexes:
+        return string
+    return replace_words(parts, indexes, {parts[index]: decrypt(parts[index]) for index in indexes}, map)
+
+# Bytes of printable ASCII text, a full match of them, and a full match of
+# printable UTF-8 text (no control characters, C1 ones included, and no 
+# overlong encodings). The regexes also work on memoryviews, without a copy
+ascii_text_bytes = string.printable.encode()
+ascii_text_re = re.compile(b'[\t-\r -~]*')
+utf8_text_re = re.compile(b'(?:[\t-\r -~]|\xc2[\xa0-\xbf]|[\xc3-\xdf][\x80-\xbf]|\xe0[\xa0-\xbf][\x80-\xbf]|'
+                          b'[\xe1-\xef][\x80-\xbf]{2}|\xf0[\x90-\xbf][\x80-\xbf]{2}|[\xf1-\xf4][\x80-\xbf]{3})*')
+unpack_length = struct.Struct('<I').unpack_from
+MIN_STRING_LEN = 4 # shorter strings are left to the fallback, which finds them as it always did
+
+def is_text(text):
+    '''True if the bytes (or memoryview) text are printable ASCII or UTF-8 text'''
+    return ascii_text_re.fullmatch(text) is not None or utf8_text_re.fullmatch(text) is not None
+
+def read_text(data, pos, end):
+    '''Returns the bytes of the length prefixed string at pos if they are 
+       printable ASCII or UTF-8 text of MIN_STRING_LEN or more, else None.
+       Only those bytes are copied out of data, which may be a memoryview'''
+    if end - pos < 4 + MIN_STRING_LEN:
+        return None
+    str_len = unpack_length(data, pos)[0]
+    if str_len < MIN_STRING_LEN or str_len > end - pos - 4:
+        return None
+    text = data[pos + 4:pos + 4 + str_len]
+    if not is_text(text):
+        return None
+    return bytes(text)
 
 def extract_strings(data, map, unobfuscate=True):
+    '''Returns the strings of a parameters blob, '' if none, the string if 
+       only one, else a list. The blob is walked by the 4 byte length prefixes 
+       of its strings. Where it holds something else (integers etc.), the
+       next string is found with ascii_chars_re, and the runs of text that
+       do not start a valid string are read as the regex scanner always did.
+       data may be a memoryview, it is read in place and only the strings
+       that are kept are copied out of it.
+    '''
+    end = len(data)
     extracted = []
-    #for match in not_control_char_re.finditer(data): # This gets all unicode chars, can include lot of garbage if you only care about English, will miss out other languages
-    for match in ascii_chars_re.finditer(data): # Matches ONLY Ascii (old behavior) , good if you only care about English
-        text = match.group()
-        if match.start() >= 4:
-            match_len = match.end() - match.start()
-            y = data[match.start() - 4 : match.start()]
-            stored_len = struct.unpack('<I', y)[0]
-            if match_len - stored_len <= 5:
-                x = text[0:stored_len].decode('utf8', 'ignore')
-                x = x.rstrip('\n').rstrip('\r')
-                x.replace('\r', '').replace('\n', ' ')
-                if unobfuscate:
-                    x = tokenized_replace(x, map)
-                extracted.append(x)
+    pos = 0
+    while pos < end:
+        # read_text(data, pos, end), inlined for the common case
+        text = None
+        if end - pos >= 4 + MIN_STRING_LEN:
+            str_len = unpack_length(data, pos)[0]
+            if MIN_STRING_LEN <= str_len <= end - pos - 4:
+                text = data[pos + 4:pos + 4 + str_len]
+                if ascii_text_re.fullmatch(text) or utf8_text_re.fullmatch(text):
+                    text = bytes(text)
+                else:
+                    text = None
+        if text is None:
+            # most often a 4 byte integer, skip it if the regex scanner could
+            # not have found text in it (its last byte is not printable), or
+            # to read a UTF-8 string, which the regex would not find whole
+            text = read_text(data, pos + 4, end)
+            if text is not None and (data[pos + 3] not in ascii_text_bytes or not text.isascii()):
+                pos += 4
             else:
-                print('invalid match - not text ', match_len - stored_len, text)
+                text = None
+        if text is not None:
+            pos += 4 + len(text)
+        else:
+            match = ascii_chars_re.search(data, pos)
+            if match is None:
+                break
+            start = match.start()
+            if start - 4 >= pos and read_text(data, start - 4, end) is not None:
+                pos = start - 4
+                continue
+            pos = match.end()
+            if start < 4:
+                continue
+            if data[start - 1] in ascii_text_bytes:
+                # continues the text of the string before, the regex scanner
+                # only kept that string
+                parse_stats['skipped non-text runs'] += 1
+                continue
+            stored_len = unpack_length(data, start - 4)[0]
+            if pos - start - stored_len > 5:
+                parse_stats['skipped non-text runs'] += 1
+                continue
+            text = match.group()[:stored_len]
+        text = text.decode('utf8', 'ignore').rstrip('\n').rstrip('\r')
+        if unobfuscate:
+            text = tokenized_replace(text, map)
+        extracted.append(text)
 
     if len(extracted) == 0:
         extracted = ''
@@ -298,14 +658,127 @@ def extract_strings(data, map, unobfuscate=True):
         extracted = extracted[0]
     return extracted
 
-def process_odl(path, map, show_all_data):
-    odl_rows = []
+DECOMPRESS_CHUNK_SIZE = 0x40000
+
+class GzipStream:
+    '''Minimal read-only file object over a gzip stream, which decompresses
+       incrementally in chunks of at most chunk_size bytes, so memory use 
+       stays flat regardless of the size of the .odlgz file.
+    '''
+    def __init__(self, f, chunk_size=DECOMPRESS_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.z = zlib.decompressobj(31)
+        self.buffer = bytearray()
+        self.eof = False
+
+    def read(self, size):
+        '''Returns up to size bytes, less only at the end of the stream'''
+        while len(self.buffer) < size and not self.eof:
+            compressed = self.z.unconsumed_tail
+            if not compressed:
+                compressed = self.f.read(self.chunk_size)
+                if not compressed: # truncated stream, return what we have
+                    self.buffer += self.z.flush()
+                    self.eof = True
+                    break
+            self.buffer += self.z.decompress(compressed, self.chunk_size)
+            if self.z.eof: # trailing data after the gzip member is ignored
+                self.eof = True
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def skip(self, size):
+        '''Discards size bytes without holding them in memory'''
+        while size > 0:
+            skipped = len(self.read(min(size, self.chunk_size)))
+            if not skipped:
+                break
+            size -= skipped
+
+    def close(self):
+        self.f.close()
+
+# Records from these Code_File / Function pairs are not shown unless -d is used,
+# in the same format as a --filter_rules file. * matches any function.
+DEFAULT_FILTER_RULES = '''
+# cache.cpp Find function provides no value, as search term or result is not present
+cache.cpp                       Find
+AclHelper.cpp                   RecordCallTimeTaken
+ActivityCenterHeaderModel.cpp   UpdateSyncStatusText
+EventMachine.cpp                FireEvent
+LogUploader2.cpp                *
+LogUploader.cpp                 *
+ServerRefreshState.cpp          *
+SyncTelemetry.cpp               *
+'''
+
+class FilterRules:
+    '''Compiled Code_File / Function rules for records that are not shown'''
+    def __init__(self, lines):
+        self.code_files = set()
+        self.functions = set()
+        for line in lines:
+            terms = line.split('#', 1)[0].split()
+            if not terms:
+                continue
+            if len(terms) == 1 or terms[1] == '*':
+                self.code_files.add(terms[0])
+            else:
+                self.functions.add((terms[0], terms[1]))
+
+    def match(self, code_file, function):
+        '''Returns the name of the matching rule, or None'''
+        if code_file in self.code_files:
+            return f'{code_file} *'
+        if (code_file, function) in self.functions:
+            return f'{code_file} {function}'
+        return None
+
+def read_filter_rules(rules_path):
+    '''Returns FilterRules from a file with one "Code_File Function" rule per line'''
+    with open(rules_path, 'r', encoding=guess_encoding(rules_path)) as f:
+        return FilterRules(f)
+
+filter_rules = FilterRules(DEFAULT_FILTER_RULES.splitlines())
+
+class MmapFile:
+    '''Minimal read-only file object over a memory mapped file, read() 
+       returns memoryview slices of the map instead of copies. The map is
+       released once the last memoryview into it is gone.
+    '''
+    def __init__(self, f):
+        self.view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        self.pos = f.tell()
+
+    def read(self, size):
+        data = self.view[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def tell(self):
+        return self.pos
+
+def read_odl_records(path, map, show_all_data, resume=None, progress=None):
+    '''Generator, yields one dict per record of the file that no filter rule
+       matches, with the parameter strings as they are stored (see 
+       process_odl)'''
     basename = os.path.basename(path)
     odl_version = 2 # default
+    stream_pos = 0
+    i = 1
+    if resume:
+        stream_pos = resume['stream_offset']
+        i = resume['file_index'] + 1
+    if progress is not None:
+        progress.update(stream_offset=stream_pos, file_index=i - 1)
     with open(path, 'rb') as f:
-        i = 1
         file_header = f.read(0x100)
-        odl_header = Odl_header.parse(file_header)
+        odl_header = parse_odl_header(file_header)
         odl_version = odl_header.odl_version
         header = odl_header.signature
         if header[0:8] == b'EBFGONED': # Odl header
@@ -316,24 +789,33 @@ def process_odl(path, map, show_all_data):
             file_pos = 8
         # Now either we have the gzip header here or the CDEF_xx header (compressed or uncompressed handles both)
         if header[0:4] == b'\x1F\x8B\x08\x00': # gzip
+            f.seek(file_pos - 8)
+            f = GzipStream(f)
             try:
-                f.seek(file_pos - 8)
-                all_data = f.read()
-                z = zlib.decompressobj(31)
-                file_data = z.decompress(all_data)
-                #print(f"zlib decompressed {len(file_data)} bytes")
+                header = f.read(8)
             except (zlib.error, OSError) as ex:
                 print(f'..decompression error for file {path} ' + str(ex))
-                return odl_rows
-            f.close()
-            f = io.BytesIO(file_data)
-            header = f.read(8)
+                return
+        else: # records are read in place, without a copy per record
+            try:
+                f = MmapFile(f)
+            except (OSError, ValueError) as ex: # not mappable, use normal reads
+                pass
         if header != b'\xCC\xDD\xEE\xFF\0\0\0\0': # CDEF_Vx header
             print('wrong header! Did not find 0xCCDDEEFF')
-            return odl_rows
+            return
+        elif stream_pos:
+            try:
+                if isinstance(f, GzipStream):
+                    f.skip(stream_pos - 8)
+                else:
+                    f.seek(file_pos - 8 + stream_pos)
+                header = f.read(56)
+            except zlib.error as ex:
+                print(f'..decompression error for file {path} ' + str(ex))
+                return
         else:
-            f.seek(-8, io.SEEK_CUR)
-            header = f.read(56) # odl complete header is 56 bytes
+            header = header + f.read(48) # odl complete header is 56 bytes
         while header and len(header) == 56:
             odl = {
                 'Filename' : basename,
@@ -343,13 +825,10 @@ def process_odl(path, map, show_all_data):
                 'Function' : '',
                 'Params_Decoded' : ''
             }
-            if odl_version == 2:
-                header = CDEF_V2.parse(header)
-            elif odl_version == 3:
-                header = CDEF_V3.parse(header)
-            else:
+            if odl_version not in (2, 3):
                 print(f'Unknown odl_version = {odl_version}')
-                return odl_rows
+                return
+            header = parse_cdef_header(header, 0, odl_version)
             timestamp = ReadUnixMsTime(header.timestamp)
             odl['Timestamp'] = timestamp
             if header.data_len <= 4:
@@ -359,51 +838,567 @@ def process_odl(path, map, show_all_data):
                 header_data_len = header.data_len - 24
             else:
                 header_data_len = header.data_len
-            data = f.read(header_data_len)
+            try:
+                data = f.read(header_data_len)
+            except zlib.error as ex:
+                print(f'..decompression error for file {path} ' + str(ex))
+                return
+            if progress is not None:
+                if len(data) < header_data_len:
+                    break # still being written, leave it for the next run
+                progress.update(stream_offset=stream_pos + 56 + header_data_len, file_index=i)
             data_pos, code_file_name = read_string(data)
-            flags = struct.unpack('<I', data[data_pos : data_pos + 4])[0]
+            flags = struct.unpack_from('<I', data, data_pos)[0]
             data_pos += 4
-            temp_pos, code_function_name = read_string(data[data_pos:])
+            temp_pos, code_function_name = read_string(data, data_pos)
             data_pos += temp_pos
-            if data_pos < header_data_len:
-                params = data[data_pos:]
-                try:
-                    strings_decoded = extract_strings(params, map)
-                    #strings_decoded_obfuscated = extract_strings(params, map, False) # for debug only
-                    #print(strings)
-                except Exception as ex:
-                    print(ex)
+            rule = None if show_all_data else filter_rules.match(code_file_name, code_function_name)
+            if rule: # irrelevant, skip decoding the parameters
+                parse_stats['filtered: ' + rule] += 1
             else:
-                strings_decoded = ''
-                # strings_decoded_obfuscated = '' # for debug only
-            #odl['Params'] = strings
-            odl['Code_File'] = code_file_name
-            odl['Function'] = code_function_name
-            odl['Params_Decoded'] = strings_decoded
-            #odl['Params_Obfuscated'] = strings_decoded_obfuscated  # for debug only
-            #print(basename, i, timestamp, code_file_name, code_function_name, strings)
-            if show_all_data:
-                odl_rows.append(odl)
-            else: # filter out irrelevant
-                # cache.cpp Find function provides no value, as search term or result is not present
-                if code_function_name == 'Find' and odl['Code_File'] == 'cache.cpp':
-                    pass
-                elif code_function_name == 'RecordCallTimeTaken' and odl['Code_File'] == 'AclHelper.cpp':
-                    pass
-                elif code_function_name == 'UpdateSyncStatusText' and odl['Code_File'] == 'ActivityCenterHeaderModel.cpp':
-                    pass
-                elif code_function_name == 'FireEvent' and odl['Code_File'] == 'EventMachine.cpp':
-                    pass
-                elif odl['Code_File'] in ('LogUploader2.cpp', 'LogUploader.cpp', 'ServerRefreshState.cpp', 'SyncTelemetry.cpp'):
-                    pass
-                elif strings_decoded == '':
-                    pass
+                if data_pos < header_data_len:
+                    params = data[data_pos:]
+                    try:
+                        strings_decoded = extract_strings(params, map, False) # decoded in decode_records
+                        #print(strings)
+                    except Exception as ex:
+                        print(ex)
                 else:
-                    odl_rows.append(odl)
+                    strings_decoded = ''
+                #odl['Params'] = strings
+                odl['Code_File'] = code_file_name
+                odl['Function'] = code_function_name
+                odl['Params_Decoded'] = strings_decoded
+                #print(basename, i, timestamp, code_file_name, code_function_name, strings)
+                yield odl
             i += 1
-            file_pos += header_data_len
-            header = f.read(56) # next cdef header
-    return odl_rows
+            stream_pos += 56 + header_data_len
+            try:
+                header = f.read(56) # next cdef header
+            except zlib.error as ex:
+                print(f'..decompression error for file {path} ' + str(ex))
+                return
+
+DECRYPT_BATCH_SIZE = 0x1000 # records whose parameters are decrypted together
+
+def decode_records(records, map, show_all_data):
+    '''Yields records with the words of their parameters decrypted, or 
+       unobfuscated with map, as tokenized_replace does (with the same
+       split_words and replace_words), using a single decrypt_batch call
+       for all of them. Records left without parameters
+       are dropped unless show_all_data.
+    '''
+    split_params = []
+    words = {}
+    for odl in records:
+        strings = odl['Params_Decoded']
+        split_strings = []
+        for string in (strings if isinstance(strings, list) else (strings,)):
+            parts, indexes = split_words(string)
+            for index in indexes:
+                words[parts[index]] = None
+            split_strings.append((string, parts, indexes))
+        split_params.append(split_strings)
+    plain = decrypt_batch(list(words))
+    for odl, split_strings in zip(records, split_params):
+        strings_decoded = [replace_words(parts, indexes, plain, map) if indexes else string 
+                           for string, parts, indexes in split_strings]
+        if not isinstance(odl['Params_Decoded'], list):
+            strings_decoded = strings_decoded[0]
+        odl['Params_Decoded'] = strings_decoded
+        if show_all_data:
+            yield odl
+        elif strings_decoded == '':
+            parse_stats['filtered: empty parameters'] += 1
+        else:
+            yield odl
+
+def process_odl(path, map, show_all_data, resume=None, progress=None):
+    '''Generator, yields one dict per (unfiltered) record in the file.
+       If progress is a dict, it is kept updated with the 'stream_offset' 
+       (offset after the CDEF stream start, so past the EBFGONED header or
+       into the decompressed data) and 'file_index' of the last complete 
+       record, and a truncated record at the end is not returned. Passing
+       such a dict back as resume continues parsing from that record.
+    '''
+    records = []
+    try:
+        for odl in read_odl_records(path, map, show_all_data, resume, progress):
+            records.append(odl)
+            if len(records) == DECRYPT_BATCH_SIZE:
+                yield from decode_records(records, map, show_all_data)
+                records = []
+    except Exception:
+        yield from decode_records(records, map, show_all_data) # the rows before the error, as unbatched
+        raise
+    yield from decode_records(records, map, show_all_data)
+
+CSV_BATCH_SIZE = 1000
+def timed(stage, func, stats=None, items=None, lock=None):
+    '''Returns func wrapped to add its run time and calls to stats (default
+       parse_stats), and the count items(result, args) returns unless None.
+       If lock is given, it is held while stats is updated.'''
+    def add(seconds, count):
+        counter = parse_stats if stats is None else stats
+        counter['seconds: ' + stage] += seconds
+        counter['calls: ' + stage] += 1
+        if count is not None:
+            counter['items: ' + stage] += count
+    def timed_func(*args, **kwargs):
+        start = time.perf_counter()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            count = items(result, args) if items else None
+            if lock is None:
+                add(seconds, count)
+            else:
+                with lock:
+                    add(seconds, count)
+    return timed_func
+
+def timed_generator(stage, func):
+    '''Returns generator function func wrapped to add the time spent in it, the
+       items it yields and, if its first argument is a file, the file size'''
+    def timed_func(*args, **kwargs):
+        start = time.perf_counter()
+        parse_stats['calls: ' + stage] += 1
+        try:
+            parse_stats['bytes: ' + stage] += os.path.getsize(args[0])
+        except (OSError, TypeError):
+            pass
+        items = func(*args, **kwargs)
+        try:
+            while True:
+                item = next(items)
+                parse_stats['seconds: ' + stage] += time.perf_counter() - start
+                parse_stats['items: ' + stage] += 1
+                yield item
+                start = time.perf_counter()
+        except StopIteration:
+            parse_stats['seconds: ' + stage] += time.perf_counter() - start
+    return timed_func
+
+untimed_stages = {} # the functions enable_timings() replaced, by name
+
+def enable_timings():
+    '''Times process_odl, extract_strings, decode_records, decrypt_batch,
+       tokenized_replace and decrypt from now on, see stage_metrics(). Times
+       include those of the stages they call. process_odl decodes through
+       decode_records and decrypt_batch, the last two stages only show up
+       for callers of extract_strings(unobfuscate=True).'''
+    global stage_timings, process_odl, extract_strings, decode_records, tokenized_replace, decrypt, decrypt_batch
+    if stage_timings:
+        return
+    stage_timings = True
+    untimed_stages.update(process_odl=process_odl, extract_strings=extract_strings, decode_records=decode_records,
+                          tokenized_replace=tokenized_replace, decrypt=decrypt, decrypt_batch=decrypt_batch)
+    process_odl = timed_generator('process_odl', process_odl)
+    extract_strings = timed('extract_strings', extract_strings)
+    decode_records = timed_generator('decode_records', decode_records)
+    tokenized_replace = timed('tokenized_replace', tokenized_replace)
+    decrypt = timed('decrypt', decrypt)
+    decrypt_batch = timed('decrypt_batch', decrypt_batch)
+
+def disable_timings():
+    '''Stops the timings of enable_timings(), for a long running process 
+       whose later runs do not ask for them'''
+    global stage_timings
+    if not stage_timings:
+        return
+    globals().update(untimed_stages)
+    untimed_stages.clear()
+    stage_timings = False
+
+def stage_metrics(stats=None):
+    '''Returns {stage: {seconds, calls, items, bytes, and their rates}} from 
+       the timings in stats (default parse_stats)'''
+    metrics = {}
+    for name, value in (parse_stats if stats is None else stats).items():
+        kind, _, stage = name.partition(': ')
+        if kind in ('seconds', 'calls', 'items', 'bytes'):
+            metrics.setdefault(stage, {})[kind] = value
+    for stage in metrics.values():
+        seconds = stage.get('seconds')
+        if seconds:
+            for kind in ('calls', 'items'):
+                if kind in stage:
+                    stage[kind + '_per_s'] = stage[kind] / seconds
+            if 'bytes' in stage:
+                stage['mb_per_s'] = stage['bytes'] / seconds / 1e6
+    return metrics
+
+def print_stage_metrics(metrics):
+    print(f"{'stage':<20} {'seconds':>9} {'calls':>10} {'items/s':>12} {'MB/s':>8}")
+    for stage, metric in sorted(metrics.items(), key=lambda item: -item[1].get('seconds', 0)):
+        rate = metric.get('items_per_s', metric.get('calls_per_s', 0))
+        print(f"{stage:<20} {metric.get('seconds', 0):>9.3f} {metric.get('calls', 0):>10} {rate:>12,.0f} {metric.get('mb_per_s', 0):>8.2f}")
+
+worker_state = {}
+
+def worker_globals():
+    '''Module settings that process pool workers need a copy of'''
+    return {'key': key, 'utf_type': utf_type, 'header_decoder': header_decoder, 'filter_rules': filter_rules,
+            'stage_timings': stage_timings}
+
+def init_worker(settings, map, show_all_data):
+    '''Process pool initializer, copies the keystore, settings and map into each worker'''
+    settings = dict(settings)
+    if settings.pop('stage_timings'):
+        enable_timings()
+    globals().update(settings)
+    worker_state['map'] = map
+    worker_state['show_all_data'] = show_all_data
+
+def process_odl_worker(path, resume, track_progress):
+    '''Process pool task, returns (odl_rows, parse_stats, progress) of a single file'''
+    parse_stats.clear()
+    progress = {} if track_progress else None
+    odl_rows = list(process_odl(path, worker_state['map'], worker_state['show_all_data'], resume, progress))
+    return odl_rows, dict(parse_stats), progress
+
+def process_odl_files(paths, map, show_all_data, jobs=1, resume_states=None, cache=None):
+    '''Yields (path, odl_rows, progress) in the same order as paths. odl_rows
+       is an iterable of rows, read lazily from the file when jobs is 1. With
+       jobs > 1, files are parsed in a process pool, while only a bounded 
+       window of files is kept in flight so results do not pile up in 
+       memory, and reading errors (OSError) are yielded in place of odl_rows.
+       If resume_states (path -> resume dict or None) is given, progress is
+       tracked for each file (see process_odl), otherwise progress is None.
+       It is only complete once odl_rows has been consumed.
+       With a ParseCache (not used when tracking progress), the rows of 
+       files parsed before are read from it and those of others added.
+    '''
+    track_progress = resume_states is not None
+    resume_states = resume_states or {}
+    if track_progress:
+        cache = None
+    if jobs <= 1:
+        for path in paths:
+            progress = {} if track_progress else None
+            odl_rows = None
+            if cache:
+                cache_key = cache.file_key(path)
+                odl_rows = cache.get(cache_key, os.path.basename(path))
+                if odl_rows is None:
+                    odl_rows = cache.caching(cache_key, process_odl(path, map, show_all_data))
+            if odl_rows is None:
+                odl_rows = process_odl(path, map, show_all_data, resume_states.get(path), progress)
+            yield path, odl_rows, progress
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, 
+                             initargs=(worker_globals(), map, show_all_data)) as executor:
+        pending = collections.deque()
+        paths = iter(paths)
+        while True:
+            while len(pending) < jobs * 2:
+                path = next(paths, None)
+                if path is None:
+                    break
+                cache_key = cache.file_key(path) if cache else None
+                cached_rows = cache.get(cache_key, os.path.basename(path)) if cache else None
+                if cached_rows is not None:
+                    pending.append((path, cache_key, cached_rows))
+                else:
+                    pending.append((path, cache_key, executor.submit(process_odl_worker, path, resume_states.get(path), track_progress)))
+            if not pending:
+                break
+            path, cache_key, future = pending.popleft()
+            progress = None
+            if isinstance(future, list):
+                yield path, future, progress
+                continue
+            try:
+                result, stats, progress = future.result()
+                parse_stats.update(stats)
+                if cache:
+                    cache.put(cache_key, result)
+            except OSError as ex:
+                result = ex
+            yield path, result, progress
+
+PARSER_VERSION = '1.8.2' # change whenever the rows for the same input change
+PARSE_CACHE_SIZE = 0x40000000 # 1 GB
+UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+def encode_rows(rows):
+    '''Returns rows of one file in a compact columnar form, code files and
+       functions are stored once each, timestamps as microseconds'''
+    code_files = {}
+    functions = {}
+    columns = {
+        'File_Index': [row['File_Index'] for row in rows],
+        'Timestamp': [(row['Timestamp'] - UNIX_EPOCH) // ONE_MICROSECOND 
+                      if isinstance(row['Timestamp'], datetime.datetime) else row['Timestamp'] for row in rows],
+        'Code_File': [code_files.setdefault(row['Code_File'], len(code_files)) for row in rows],
+        'Function': [functions.setdefault(row['Function'], len(functions)) for row in rows],
+        'Params_Decoded': [row['Params_Decoded'] for row in rows],
+        'code_files': list(code_files),
+        'functions': list(functions)
+    }
+    return zlib.compress(json.dumps(columns, ensure_ascii=False, separators=(',', ':')).encode('utf8'))
+
+def decode_rows(data, basename):
+    '''Returns the rows stored by encode_rows(), for the file named basename'''
+    columns = json.loads(zlib.decompress(data).decode('utf8'))
+    code_files = columns['code_files']
+    functions = columns['functions']
+    return [{
+                'Filename' : basename,
+                'File_Index' : file_index,
+                'Timestamp' : UNIX_EPOCH + timestamp * ONE_MICROSECOND if isinstance(timestamp, int) else timestamp,
+                'Code_File' : code_files[code_file],
+                'Function' : functions[function],
+                'Params_Decoded' : params
+            } for file_index, timestamp, code_file, function, params in zip(columns['File_Index'], 
+                columns['Timestamp'], columns['Code_File'], columns['Function'], columns['Params_Decoded'])]
+
+def parse_cache_context(obfuscation_map_path, all_key_values, show_all_data):
+    '''Returns what, besides the file content, decides the rows of a file: the
+       parser version, keystore, ObfuscationStringMap, options and filter rules'''
+    map_sha256 = file_sha256(obfuscation_map_path) if os.path.exists(obfuscation_map_path) else ''
+    rules = sorted(filter_rules.code_files) + sorted(' '.join(rule) for rule in filter_rules.functions)
+    return json.dumps([PARSER_VERSION, key.hex() if isinstance(key, bytes) else key, utf_type, map_sha256, all_key_values, show_all_data, rules])
+
+class ParseCache:
+    '''Decoded rows of ODL files, keyed by the hash of the file content and 
+       the parse context, in cache_dir/parsecache.sqlite. The least recently
+       used files are dropped once the stored rows take more than max_size.
+       The rows are stored decrypted, so cache_dir should belong to the case.
+    '''
+    def __init__(self, cache_dir, context, max_size=PARSE_CACHE_SIZE):
+        db_path = os.path.join(cache_dir, 'parsecache.sqlite')
+        create_private_file(db_path)
+        self.db = sqlite3.connect(db_path, timeout=60)
+        self.db.execute('CREATE TABLE IF NOT EXISTS files (key TEXT PRIMARY KEY, size INTEGER, last_used REAL, data BLOB)')
+        self.context = context
+        self.max_size = max_size
+
+    def file_key(self, path):
+        '''Returns the cache key of the file at path'''
+        return hashlib.sha256((file_sha256(path) + self.context).encode('utf8')).hexdigest()
+
+    def get(self, cache_key, basename):
+        '''Returns the cached rows, or None'''
+        try:
+            row = self.db.execute('SELECT data FROM files WHERE key = ?', (cache_key,)).fetchone()
+            if row is None:
+                parse_stats['parse_cache_misses'] += 1
+                return None
+            with self.db:
+                self.db.execute('UPDATE files SET last_used = ? WHERE key = ?', (time.time(), cache_key))
+        except sqlite3.Error as ex:
+            print(f'Error reading parse cache: {ex}')
+            return None
+        parse_stats['parse_cache_hits'] += 1
+        return decode_rows(row[0], basename)
+
+    def put(self, cache_key, rows):
+        '''Stores the rows of a file, then drops the least recently used files over max_size'''
+        data = encode_rows(rows)
+        if len(data) > self.max_size:
+            return
+        try:
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', (cache_key, len(data), time.time(), data))
+                total = self.db.execute('SELECT SUM(size) FROM files').fetchone()[0]
+                for old_key, size in self.db.execute('SELECT key, size FROM files ORDER BY last_used').fetchall():
+                    if total <= self.max_size:
+                        break
+                    self.db.execute('DELETE FROM files WHERE key = ?', (old_key,))
+                    total -= size
+                    parse_stats['parse_cache_evictions'] += 1
+        except sqlite3.Error as ex:
+            print(f'Error writing parse cache: {ex}')
+
+    def caching(self, cache_key, odl_rows):
+        '''Yields odl_rows, and stores them once all were read without errors'''
+        rows = []
+        for row in odl_rows:
+            rows.append(row)
+            yield row
+        self.put(cache_key, rows)
+
+    def close(self):
+        self.db.close()
+
+def find_odl_files(odl_folder):
+    '''Returns the paths of all ODL files in odl_folder, in processing order'''
+    glob_patterns = ('*.odl', '*.odlgz', '*.odlsent', '*.aodl')
+    paths = []
+    for pattern in glob_patterns:
+        paths.extend(glob.glob(os.path.join(odl_folder, pattern)))
+    return paths
+
+def load_obfuscation_map(odl_folder, obfuscation_map_path=None, all_key_values=False, index_dir=None):
+    '''Returns the ObfuscationStringMap of odl_folder (or at obfuscation_map_path)
+       as an index if index_dir is given, else as a dict, {} if there is none'''
+    if not obfuscation_map_path:
+        obfuscation_map_path = os.path.join(odl_folder, "ObfuscationStringMap.txt")
+
+    if not os.path.exists(obfuscation_map_path):
+        print(f'"ObfuscationStringMap.txt" not found in {odl_folder}.')
+        map = {}
+    elif not index_dir:
+        map = load_once(obfuscation_map_path, (all_key_values, None), lambda: read_obfuscation_map(obfuscation_map_path, all_key_values))
+        print(f'Read {len(map)} items from map')
+    else:
+        map = load_once(obfuscation_map_path, (all_key_values, index_dir), 
+                        lambda: open_obfuscation_map_index(obfuscation_map_path, all_key_values, index_dir))
+        print(f'Opened index of {len(map)} items from map')
+    return map
+
+def load_keystore(odl_folder):
+    '''Sets the key from the general.keystore of odl_folder, clears it if none is found'''
+    global key
+    key = ''
+    keystore_path = os.path.join(odl_folder, "general.keystore")
+    if not os.path.exists(keystore_path):
+        # Try new path
+        keystore_path = os.path.join(odl_folder, "EncryptionKeyStoreCopy", "general.keystore")
+        if not os.path.exists(keystore_path):
+            print(f'"general.keystore" not found in {odl_folder}. WARNING: Strings will not be decoded!!')
+        else:
+            read_keystore(keystore_path)
+    else:
+        read_keystore(keystore_path)
+
+def open_parse_cache(odl_folder, obfuscation_map_path, all_key_values, show_all_data, cache_dir, cache_size=PARSE_CACHE_SIZE):
+    '''Returns the ParseCache in cache_dir for the current keystore and settings'''
+    if not obfuscation_map_path:
+        obfuscation_map_path = os.path.join(odl_folder, "ObfuscationStringMap.txt")
+    context = parse_cache_context(obfuscation_map_path, all_key_values, show_all_data)
+    return ParseCache(cache_dir, context, cache_size)
+
+def parse_odl_folder(odl_folder, obfuscation_map_path=None, all_key_values=False, show_all_data=False, 
+                     jobs=1, index_dir=None, cache_dir=None, cache_size=PARSE_CACHE_SIZE):
+    '''Library entry point, reads the keystore and map of odl_folder and yields
+       the rows of all its ODL files, in the same order main() writes them.
+       Uses the module level settings (key, filter_rules, ..), so only one 
+       folder should be parsed at a time per process. With cache_dir, the 
+       rows of files parsed before with the same settings come from a 
+       ParseCache there.
+    '''
+    map = load_obfuscation_map(odl_folder, obfuscation_map_path, all_key_values, index_dir)
+    load_keystore(odl_folder)
+    cache = open_parse_cache(odl_folder, obfuscation_map_path, all_key_values, show_all_data, cache_dir, cache_size) if cache_dir else None
+    paths = [path for path in find_odl_files(odl_folder) if not is_file_empty(path)]
+    try:
+        for path, odl_rows, _ in process_odl_files(paths, map, show_all_data, jobs, cache=cache):
+            if isinstance(odl_rows, OSError):
+                print(f"Error - File not found! {path}")
+                continue
+            try:
+                yield from odl_rows
+            except OSError as ex:
+                print(f"Error - File not found! {path}")
+    finally:
+        if cache:
+            cache.close()
+
+RESUME_PREFIX_SIZE = 0x1000
+
+def file_identity(path):
+    '''Returns a dict of size, mtime and the hash of the first bytes of a file'''
+    stat = os.stat(path)
+    prefix_size = min(stat.st_size, RESUME_PREFIX_SIZE)
+    with open(path, 'rb') as f:
+        prefix_sha256 = hashlib.sha256(f.read(prefix_size)).hexdigest()
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'prefix_size': prefix_size, 'prefix_sha256': prefix_sha256}
+
+def read_resume_manifest(manifest_path):
+    '''Returns the per file entries of a resume manifest, {} if there is none'''
+    try:
+        with open(manifest_path, 'r', encoding='utf8') as f:
+            return json.load(f)['files']
+    except (OSError, ValueError, KeyError) as ex:
+        print(f'Could not read resume manifest {manifest_path}, parsing everything. ' + str(ex))
+        return {}
+
+def write_resume_manifest(manifest_path, files):
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf8') as f:
+        json.dump({'version': 1, 'files': files}, f, indent=1)
+    os.replace(temp_path, manifest_path)
+
+def get_resume_state(path, entry):
+    '''Compares a file with its manifest entry from the last run, returns one 
+       of new, unchanged, appended or replaced'''
+    if not entry:
+        return 'new'
+    identity = file_identity(path)
+    if identity['size'] < entry['size'] or identity['prefix_size'] < entry['prefix_size']:
+        return 'replaced'
+    if identity['prefix_size'] != entry['prefix_size']: # was shorter than RESUME_PREFIX_SIZE
+        with open(path, 'rb') as f:
+            prefix_sha256 = hashlib.sha256(f.read(entry['prefix_size'])).hexdigest()
+    else:
+        prefix_sha256 = identity['prefix_sha256']
+    if prefix_sha256 != entry['prefix_sha256']:
+        return 'replaced'
+    if identity['size'] == entry['size'] and identity['mtime'] == entry['mtime']:
+        return 'unchanged'
+    return 'appended'
+
+FOLLOW_INTERVAL = 1.0
+
+def rotated_from(path, files):
+    '''Returns the path of a file in files that path is a rotated copy of,
+       the same name with another extension (.odl compressed into .odlgz)'''
+    stem = os.path.splitext(path)[0]
+    for other_path in files:
+        if other_path != path and os.path.splitext(other_path)[0] == stem:
+            return other_path
+    return None
+
+def follow_odl_folder(odl_folder, map, show_all_data, files, interval=FOLLOW_INTERVAL):
+    '''Generator, polls odl_folder every interval seconds and yields (path, rows)
+       of the records completed since the last poll, reading each file on 
+       from where it was left. files (path -> manifest entry, see 
+       get_resume_state) holds how far each file was read and is kept up
+       to date. A file rotated into another extension continues from the
+       entry of the original, which is dropped once that file is gone.
+    '''
+    while True:
+        paths = find_odl_files(odl_folder)
+        for path in paths:
+            if is_file_empty(path):
+                continue
+            entry = files.get(path)
+            resume = None
+            if entry:
+                stat = os.stat(path)
+                if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+                    continue
+                state = get_resume_state(path, entry)
+                if state == 'replaced':
+                    print(f'WARNING: {path} was replaced, parsing it again from the start')
+                elif state == 'appended':
+                    resume = entry
+            else:
+                original_path = rotated_from(path, files)
+                if original_path:
+                    print(f'{path} was rotated from {os.path.basename(original_path)}, continuing after its last record')
+                    resume = files[original_path]
+            # before parsing, so anything written meanwhile is seen as appended next time
+            identity = file_identity(path)
+            progress = {}
+            try:
+                odl_rows = list(process_odl(path, map, show_all_data, resume, progress))
+            except OSError as ex:
+                print(f'Error reading {path}: ' + str(ex))
+                continue
+            files[path] = dict(identity, **progress)
+            yield path, odl_rows
+        current_paths = set(paths)
+        for path in [path for path in files if path not in current_paths and rotated_from(path, files)]:
+            del files[path]
+        time.sleep(interval)
 
 def main():
     usage = \
@@ -432,6 +1427,24 @@ are not displayed. This can be toggled with the -d option.
     parser.add_argument('-s', '--obfuscationstringmap_path', help='Path to ObfuscationStringMap.txt (if not in odl_folder)')
     parser.add_argument('-k', '--all_key_values', action='store_true', help='For repeated keys in ObfuscationMap, get all values | delimited (off by default)')
     parser.add_argument('-d', '--all_data', action='store_true', help='Show all data (off by default)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of files to parse in parallel, 0 = one per CPU (default 1)')
+    parser.add_argument('--header_decoder', choices=['fast', 'construct', 'validate'], default='fast', 
+                        help='Record header decoder, validate runs both and reports mismatches (default fast)')
+    parser.add_argument('--index_dir', metavar='DIR', 
+                        help='Compile ObfuscationStringMap into an index in DIR, reused by later runs (off by default, use a folder of the case)')
+    parser.add_argument('-f', '--filter_rules', help='File of "Code_File Function" rules for records to hide, replaces the built-in rules')
+    parser.add_argument('-i', '--incremental', action='store_true', 
+                        help='Only parse records added since the last incremental run, and append them to the output')
+    parser.add_argument('--follow', action='store_true', 
+                        help='Keep watching odl_folder, appending the records of new and growing files as they are written')
+    parser.add_argument('--interval', type=float, default=FOLLOW_INTERVAL, 
+                        help='Seconds between checks of odl_folder with --follow (default %(default)s)')
+    parser.add_argument('--cache', metavar='DIR', 
+                        help='Reuse the rows of files parsed before, kept decrypted in DIR/parsecache.sqlite (off by default, use a folder of the case)')
+    parser.add_argument('--cache_size', type=int, default=PARSE_CACHE_SIZE // 0x100000, 
+                        help='Most MB the parse cache may take (default %(default)s)')
+    parser.add_argument('--metrics', help='Time each parsing stage and save the timings and counters to this JSON file')
+    parser.add_argument('--profile', help='Run under cProfile and save the profile to this file (main process only)')
     
     args = parser.parse_args()
 
@@ -441,66 +1454,160 @@ are not displayed. This can be toggled with the -d option.
     if not os.path.isdir(odl_folder):
         print(f'Error, {odl_folder} is not a folder!')
         return
+    if args.jobs < 1:
+        args.jobs = os.cpu_count() or 1
+    global header_decoder
+    header_decoder = args.header_decoder
+    index_dir = args.index_dir
+    if args.filter_rules:
+        global filter_rules
+        try:
+            filter_rules = read_filter_rules(args.filter_rules)
+        except OSError as ex:
+            print(f'Error reading filter rules {args.filter_rules}: ' + str(ex))
+            return
     if not csv_file_path:
         csv_file_path = os.path.join(odl_folder, 'ODL_Report.csv')
     elif not csv_file_path.endswith('.csv'):
         csv_file_path += '.csv'
 
-    if args.obfuscationstringmap_path:
-        obfuscation_map_path = args.obfuscationstringmap_path
-    else:
-        obfuscation_map_path = os.path.join(odl_folder, "ObfuscationStringMap.txt")
+    start_time = time.perf_counter()
+    if args.metrics:
+        enable_timings()
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
 
-    if not os.path.exists(obfuscation_map_path):
-        print(f'"ObfuscationStringMap.txt" not found in {odl_folder}.')
-        map = {}
-    else:
-        map = read_obfuscation_map(obfuscation_map_path, args.all_key_values)
-        print(f'Read {len(map)} items from map')
-    
-    keystore_path = os.path.join(odl_folder, "general.keystore")
-    if not os.path.exists(keystore_path):
-        # Try new path
-        keystore_path = os.path.join(odl_folder, "EncryptionKeyStoreCopy", "general.keystore")
-        if not os.path.exists(keystore_path):
-            print(f'"general.keystore" not found in {odl_folder}. WARNING: Strings will not be decoded!!')
-        else:
-            read_keystore(keystore_path)
-    else:
-        read_keystore(keystore_path)
+    map = load_obfuscation_map(odl_folder, args.obfuscationstringmap_path, args.all_key_values, index_dir)
+    load_keystore(odl_folder)
 
+    manifest_path = csv_file_path[:-4] + '_resume.json'
+    manifest = {}
+    append = False
+    if args.incremental and os.path.exists(manifest_path) and os.path.exists(csv_file_path):
+        manifest = read_resume_manifest(manifest_path)
+        append = bool(manifest)
     try:
         fieldnames = 'Filename,File_Index,Timestamp,Code_File,Function,Params_Decoded'.split(',')
-        csv_f = open(csv_file_path, 'w', encoding='UTF8')
+        csv_f = open(csv_file_path, 'a' if append else 'w', encoding='UTF8')
         writer = csv.DictWriter(csv_f, fieldnames=fieldnames)
-        writer.writeheader()
+        if not append:
+            writer.writeheader()
     except:
         print(f"Failed to create csv file: {csv_file_path} ")
         return
 
-    glob_patterns = ('*.odl', '*.odlgz', '*.odlsent', '*.aodl')
-    paths = []
-    for pattern in glob_patterns:
-        paths.extend(glob.glob(os.path.join(odl_folder, pattern)))
+    paths = find_odl_files(odl_folder)
+    empty_paths = set()
+    unchanged_paths = set()
+    # follow mode needs to know how far each file was read, like -i
+    track_progress = args.incremental or args.follow
+    resume_states = {} if track_progress else None
+    identities = {}
     for path in paths:
-        print("Searching ", path)
         if is_file_empty(path):
+            empty_paths.add(path)
+        elif track_progress:
+            identities[path] = file_identity(path)
+            state = get_resume_state(path, manifest.get(path))
+            if state == 'unchanged':
+                unchanged_paths.add(path)
+            elif state == 'appended':
+                resume_states[path] = manifest[path]
+            elif state == 'replaced':
+                print(f'WARNING: {path} was replaced since the last run, parsing it again from the start')
+    parse_paths = [path for path in paths if path not in empty_paths and path not in unchanged_paths]
+    cache = None
+    if args.cache and not track_progress:
+        cache = open_parse_cache(odl_folder, args.obfuscationstringmap_path, args.all_key_values, args.all_data, 
+                                 args.cache, args.cache_size * 0x100000)
+    results = process_odl_files(parse_paths, map, args.all_data, args.jobs, resume_states, cache)
+    for path in paths:
+        print("Searching ", path)
+        if path in empty_paths:
             print("File is empty, file size is 0 bytes")
-        else:
+            continue
+        if path in unchanged_paths:
+            print("No new data since the last run.")
+            continue
+        _, odl_rows, progress = next(results)
+        if isinstance(odl_rows, OSError):
+            print(f"Error - File not found! {path}")
+            continue
+        odl_rows = iter(odl_rows)
+        row_count = 0
+        while True:
             try:
-                odl_rows = process_odl(path, map, args.all_data)
-                try:
-                    if odl_rows:
-                        writer.writerows(odl_rows)
-                        print(f'Wrote {len(odl_rows)} rows')
-                    else:
-                        print("No log data was found in this file.")
-                except Exception as ex:
-                    print("ERROR writing rows:", type(ex), ex)
+                batch = list(itertools.islice(odl_rows, CSV_BATCH_SIZE))
             except OSError as ex:
                 print(f"Error - File not found! {path}")
+                break
+            if not batch:
+                break
+            try:
+                writer.writerows(batch)
+                row_count += len(batch)
+            except Exception as ex:
+                print("ERROR writing rows:", type(ex), ex)
+        if row_count:
+            print(f'Wrote {row_count} rows')
+        else:
+            print("No log data was found in this file.")
+        if progress:
+            manifest[path] = dict(identities[path], **progress)
+
+    if args.follow:
+        if args.incremental:
+            write_resume_manifest(manifest_path, manifest)
+        csv_f.flush()
+        print(f'Following {odl_folder}, new records are appended to {csv_file_path}, Ctrl+C to stop')
+        try:
+            for path, odl_rows in follow_odl_folder(odl_folder, map, args.all_data, manifest, args.interval):
+                if odl_rows:
+                    writer.writerows(odl_rows)
+                    csv_f.flush()
+                    print(f'{time.strftime("%H:%M:%S")} {os.path.basename(path)}: {len(odl_rows)} new rows')
+                if args.incremental:
+                    write_resume_manifest(manifest_path, manifest)
+        except KeyboardInterrupt:
+            print('Stopped following')
 
     csv_f.close()
+    if cache:
+        cache.close()
+    if args.incremental:
+        write_resume_manifest(manifest_path, manifest)
+    print(f"Decoded {parse_stats['cdef_fast'] + parse_stats['cdef_construct']} record headers "
+          f"(fast path: {parse_stats['cdef_fast']}, construct: {parse_stats['cdef_construct']})")
+    cache_lookups = parse_stats['decrypt_cache_hits'] + parse_stats['decrypt_cache_misses']
+    if cache_lookups:
+        print(f"Decryption cache: {parse_stats['decrypt_cache_hits']} hits, {parse_stats['decrypt_cache_misses']} misses "
+              f"({100 * parse_stats['decrypt_cache_hits'] / cache_lookups:.1f}% hit rate)")
+    if cache:
+        print(f"Parse cache {os.path.join(args.cache, 'parsecache.sqlite')}: {parse_stats['parse_cache_hits']} files reused, {parse_stats['parse_cache_misses']} parsed")
+    filtered = sorted((name[10:], count) for name, count in parse_stats.items() if name.startswith('filtered: '))
+    if filtered:
+        print(f'Filtered {sum(count for _, count in filtered)} records:')
+        for rule, count in filtered:
+            print(f'  {count:>10}  {rule}')
+    if parse_stats['cdef_mismatch']:
+        print(f"WARNING: {parse_stats['cdef_mismatch']} record headers differed between decoders")
+    if profiler:
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+        print(f'Profile saved to {args.profile}')
+    if args.metrics:
+        metrics = stage_metrics()
+        print_stage_metrics(metrics)
+        counters = {name: count for name, count in parse_stats.items() if name.partition(': ')[2] not in metrics}
+        with open(args.metrics, 'w', encoding='utf8') as f:
+            json.dump({'total_seconds': time.perf_counter() - start_time, 'jobs': args.jobs,
+                       'stages': metrics, 'counters': counters}, f, indent=1)
+        print(f'Metrics saved to {args.metrics}')
     print(f'Finished processing files, output is at {csv_file_path}')
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+RBODLcmd.py client
+------------------
+Sends a RBODLcmd.py command line to a running 'RBODLcmd.py serve' process
+and prints its output, so small jobs skip the imports, keystore and map
+loading, and the admin relaunch of a fresh RBODLcmd.py run.
+
+The server listens on 127.0.0.1 only, and writes its port and a random
+token to server.json in the user's cache folder, which only the same user
+can read. Every request carries that token.
+
+Usage   : rbodlclient.py RBODLcmd.py arguments, e.g. -t odl -p C:\\logs\\Business1 -o out
+          rbodlclient.py query DATABASE [filters]
+          rbodlclient.py status | stop
+
+Only needs the python standard library.
+"""
+
+import http.client
+import json
+import os
+import sys
+
+def server_info_path():
+    '''server.json in the per user cache folder'''
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'odl', 'server.json')
+
+def write_server_info(port, token):
+    '''Writes the port and token of this server process, readable by this user only'''
+    path = server_info_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf8') as f:
+        json.dump({'port': port, 'token': token, 'pid': os.getpid()}, f)
+
+def read_server_info():
+    '''Returns the server.json dict, or None if no server was started'''
+    try:
+        with open(server_info_path(), encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def request(info, method, path, body=None):
+    '''Returns the HTTP response of the server for method and path'''
+    connection = http.client.HTTPConnection('127.0.0.1', info['port'])
+    headers = {'X-Token': info['token'], 'Content-Type': 'application/json'}
+    connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+    return connection.getresponse()
+
+def run(info, argv, out=sys.stdout):
+    '''Runs argv on the server, writing its output to out as it comes.
+       Returns the result dict of the run.'''
+    response = request(info, 'POST', '/run', {'argv': argv, 'cwd': os.getcwd()})
+    if response.status != 200:
+        return {'ok': False, 'error': f'{response.status} {response.reason}'}
+    result = {'ok': False, 'error': 'Connection closed before the run finished'}
+    for line in response:
+        message = json.loads(line)
+        if 'log' in message:
+            out.write(message['log'])
+            out.flush()
+        else:
+            result = message['result']
+    return result
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(__doc__)
+        return 0
+    info = read_server_info()
+    if info is None:
+        print(f'No server found ({server_info_path()} is missing), start one with: RBODLcmd.py serve')
+        return 2
+    try:
+        if argv == ['status']:
+            response = request(info, 'GET', '/status')
+            print(json.dumps(json.loads(response.read()), indent=1))
+            return 0 if response.status == 200 else 1
+        if argv == ['stop']:
+            response = request(info, 'POST', '/stop')
+            print('Server stopped' if response.status == 200 else f'Error, {response.status} {response.reason}')
+            return 0 if response.status == 200 else 1
+        result = run(info, argv)
+    except OSError as ex:
+        print(f'Error, could not reach the server on port {info["port"]} ({ex}), start one with: RBODLcmd.py serve')
+        return 2
+    if not result.get('ok'):
+        print(f"Error, {result.get('error', 'the run failed')}")
+        return 1
+    print(f"Done in {result['seconds']:.2f}s" + (f", output in {result['output_path']}" if result.get('output_path') else ''))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Read Windows Recycle Bin $I files
+---------------------------------
+Every deleted item in C:\\$Recycle.Bin\\<UserSID> has a $I metadata file
+holding its original size, deletion time and original path, next to the
+$R file with the content. There are two formats:
+
+Version 1 (Vista to 8.1)        Version 2 (10 and later)
+ 0x00  Int64  version = 1        0x00  Int64  version = 2
+ 0x08  Int64  file size          0x08  Int64  file size
+ 0x10  Int64  deleted FILETIME   0x10  Int64  deleted FILETIME
+ 0x18  520 bytes UTF16 path      0x18  Int32  path length in characters
+                                 0x1C  UTF16 path
+
+The files are read in place (no copies) and in parallel, and rows have
+the same columns as the CSV output of RBCmd.exe.
+
+Usage   : recyclebin.py [-o OUTPUT_PATH] [-j JOBS] recycle_bin_folder
+
+Requires python3.7+
+"""
+
+import argparse
+import csv
+import datetime
+import glob
+import os
+import struct
+
+from concurrent.futures import ThreadPoolExecutor
+
+RB_COLUMNS = ['SourceName', 'FileType', 'FileName', 'FileSize', 'DeletedOn']
+I_FILE_HEADER = struct.Struct('<qqq') # version, file size, deleted FILETIME
+
+def ReadWindowsFileTime(filetime):
+    '''Returns datetime object (UTC), or empty string upon error'''
+    if filetime not in (0, None):
+        try:
+            return datetime.datetime(1601, 1, 1) + datetime.timedelta(microseconds=filetime / 10)
+        except (ValueError, OverflowError, TypeError):
+            pass
+    return ''
+
+def parse_i_file(path):
+    '''Returns a row dict for one $I file, or None if it is not valid'''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < I_FILE_HEADER.size:
+        return None
+    version, file_size, deleted_time = I_FILE_HEADER.unpack_from(data)
+    if version == 1:
+        name = data[0x18:0x18 + 520]
+    elif version == 2 and len(data) >= 0x1C:
+        name_len = struct.unpack_from('<I', data, 0x18)[0]
+        name = data[0x1C:0x1C + name_len * 2]
+    else:
+        print(f'Unknown $I version {version} in {path}')
+        return None
+    name = name.decode('utf-16le', 'ignore').split('\0', 1)[0]
+    deleted_on = ReadWindowsFileTime(deleted_time)
+    if deleted_on:
+        deleted_on = deleted_on.strftime('%Y-%m-%d %H:%M:%S')
+    return {
+        'SourceName' : path,
+        'FileType' : '$I',
+        'FileName' : name,
+        'FileSize' : file_size,
+        'DeletedOn' : deleted_on
+    }
+
+def parse_i_file_safe(path):
+    '''parse_i_file() that prints errors instead of raising them'''
+    try:
+        return parse_i_file(path)
+    except OSError as ex:
+        print(f'Error reading {path}: {ex}')
+        return None
+
+def parse_recycle_bin(folder, jobs=8):
+    '''Returns the rows of all $I files in folder, sorted by file name'''
+    paths = sorted(glob.glob(os.path.join(glob.escape(folder), '$I*')))
+    rows = []
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        for row in executor.map(parse_i_file_safe, paths):
+            if row:
+                rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Recycle Bin $I file reader')
+    parser.add_argument('recycle_bin_folder', help=r'Path to a C:\$Recycle.Bin\<UserSID> folder')
+    parser.add_argument('-o', '--output_path', help='Output file name and path')
+    parser.add_argument('-j', '--jobs', type=int, default=8, help='Files to read in parallel (default 8)')
+    args = parser.parse_args()
+
+    folder = os.path.abspath(args.recycle_bin_folder)
+    if not os.path.isdir(folder):
+        print(f'Error, {folder} is not a folder!')
+        return
+    csv_file_path = args.output_path or os.path.join(folder, 'RecycleBin_Report.csv')
+    rows = parse_recycle_bin(folder, args.jobs)
+    with open(csv_file_path, 'w', encoding='UTF8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RB_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f'Wrote {len(rows)} rows, output is at {csv_file_path}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+SQLite result store
+-------------------
+Keeps the parsed ODL and Recycle Bin rows of any number of runs in one
+SQLite database, so that questions like "what happened to file X between
+T1 and T2" are an indexed lookup instead of reloading spreadsheets.
+
+Tables
+ runs  RunId, Started, Tool, Path, Rows, Added
+ odl   Timestamp, Filename, Code_File, Function, Params_Decoded, File
+ rb    DeletedOn, UserSID, SourceName, FileType, FileName, FileSize, File
+
+File is the file name an ODL record is about (taken from its parameters)
+or the name of the deleted file. Rows are keyed by a hash of their values,
+so storing the same run again adds nothing and only new rows are appended.
+Times are stored as 'YYYY-MM-DD HH:MM:SS' text and compare as such.
+
+Usage   : resultstore.py DATABASE [-f FILE] [--from TIME] [--to TIME] [--code_file CODE_FILE]
+                         [--function FUNCTION] [--sid USERSID] [--text TEXT] [-n LIMIT] [--csv OUTPUT]
+
+Requires python3.7+ and pandas
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (RunId INTEGER PRIMARY KEY, Started TEXT, Tool TEXT, Path TEXT, Rows INTEGER, Added INTEGER);
+CREATE TABLE IF NOT EXISTS odl (RowHash INTEGER PRIMARY KEY, RunId INTEGER, Timestamp TEXT, Filename TEXT,
+                                Code_File TEXT, Function TEXT, Params_Decoded TEXT, File TEXT);
+CREATE TABLE IF NOT EXISTS rb (RowHash INTEGER PRIMARY KEY, RunId INTEGER, DeletedOn TEXT, UserSID TEXT, SourceName TEXT,
+                               FileType TEXT, FileName TEXT, FileSize INTEGER, File TEXT);
+CREATE INDEX IF NOT EXISTS odl_timestamp ON odl (Timestamp);
+CREATE INDEX IF NOT EXISTS odl_code_file ON odl (Code_File, Timestamp);
+CREATE INDEX IF NOT EXISTS odl_function ON odl (Function, Timestamp);
+CREATE INDEX IF NOT EXISTS odl_file ON odl (File COLLATE NOCASE, Timestamp);
+CREATE INDEX IF NOT EXISTS rb_deleted_on ON rb (DeletedOn);
+CREATE INDEX IF NOT EXISTS rb_user_sid ON rb (UserSID, DeletedOn);
+CREATE INDEX IF NOT EXISTS rb_file ON rb (File COLLATE NOCASE, DeletedOn);
+'''
+TABLE_COLUMNS = {
+    'odl': ['Timestamp', 'Filename', 'Code_File', 'Function', 'Params_Decoded', 'File'],
+    'rb': ['DeletedOn', 'UserSID', 'SourceName', 'FileType', 'FileName', 'FileSize', 'File'],
+}
+FILE_IN_PARAMS_RE = r'\\([^\\]+)\']' # same as the concurrency check
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def open_store(db_path):
+    '''Returns a connection to the store at db_path, created if needed'''
+    db = sqlite3.connect(db_path)
+    db.executescript(SCHEMA)
+    return db
+
+def time_text(series):
+    '''Returns datetimes or time strings as TIME_FORMAT text, None for missing ones'''
+    times = pd.to_datetime(series, errors='coerce')
+    return times.dt.strftime(TIME_FORMAT).astype(object).where(times.notna(), None)
+
+def prepare_rows(tool, df):
+    '''Returns the DataFrame of a parsed ODL or RB result as a frame of the table columns'''
+    df = df.copy()
+    if tool == 'odl':
+        df['Timestamp'] = time_text(df['Timestamp'])
+        df['File'] = df['Params_Decoded'].astype(str).str.extract(FILE_IN_PARAMS_RE, expand=False)
+    else:
+        df['DeletedOn'] = time_text(df['DeletedOn'])
+        df['File'] = df['FileName'].astype(str).str.extract(r'([^\\]+)$', expand=False)
+        df['FileSize'] = pd.to_numeric(df['FileSize'], errors='coerce')
+    df = df.reindex(columns=TABLE_COLUMNS[tool]).astype(object)
+    return df.where(df.notna(), None)
+
+def row_hashes(df):
+    '''64 bit hashes of the row values and of how many identical rows came
+       before each one, so repeated identical records are all kept'''
+    occurrence = df.fillna('').groupby(list(df.columns), sort=False).cumcount()
+    keyed = df.astype(str).assign(Occurrence=occurrence)
+    return pd.util.hash_pandas_object(keyed, index=False).astype('int64')
+
+def store_frame(db_path, tool, path, df):
+    '''Appends the parsed rows of one tool run, returns (rows, rows added)'''
+    rows = prepare_rows(tool, df)
+    columns = TABLE_COLUMNS[tool]
+    db = open_store(db_path)
+    try:
+        with db:
+            cursor = db.execute('INSERT INTO runs (Started, Tool, Path, Rows) VALUES (?, ?, ?, ?)',
+                                (datetime.datetime.now().strftime(TIME_FORMAT), tool, path, len(rows)))
+            run_id = cursor.lastrowid
+            before = db.total_changes
+            db.executemany(f"INSERT OR IGNORE INTO {tool} (RowHash, RunId, {', '.join(columns)}) "
+                           f"VALUES ({', '.join('?' * (len(columns) + 2))})",
+                           zip(row_hashes(rows).tolist(), [run_id] * len(rows), *(rows[column].tolist() for column in columns)))
+            added = db.total_changes - before
+            db.execute('UPDATE runs SET Added = ? WHERE RunId = ?', (added, run_id))
+    finally:
+        db.close()
+    return len(rows), added
+
+def query(db_path, file=None, start=None, end=None, code_file=None, function=None, sid=None, text=None, limit=None):
+    '''Returns (columns, rows) of ODL events and Recycle Bin deletions matching
+       all the given filters as one timeline, newest first'''
+    parts = []
+    params = []
+    if not sid:
+        where, where_params = build_where('Timestamp', file, start, end, text, 'Params_Decoded',
+                                          [('Code_File', code_file), ('Function', function)])
+        parts.append("SELECT Timestamp AS Time, 'odl' AS Source, File, Code_File || ' ' || Function AS Event, "
+                     "Params_Decoded AS Details, Filename AS Origin FROM odl" + where)
+        params.extend(where_params)
+    if not code_file and not function:
+        where, where_params = build_where('DeletedOn', file, start, end, text, 'FileName', [('UserSID', sid)])
+        parts.append("SELECT DeletedOn AS Time, 'rb' AS Source, File, 'Deleted ' || UserSID AS Event, "
+                     "FileName AS Details, SourceName AS Origin FROM rb" + where)
+        params.extend(where_params)
+    sql = ' UNION ALL '.join(parts) + ' ORDER BY Time DESC'
+    if limit:
+        sql += f' LIMIT {int(limit)}'
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        cursor = db.execute(sql, params)
+        return [column[0] for column in cursor.description], cursor.fetchall()
+    finally:
+        db.close()
+
+def build_where(time_column, file, start, end, text, text_column, equals):
+    '''Returns (' WHERE ...', params) for the filters that are set'''
+    conditions = []
+    params = []
+    if file:
+        conditions.append('File = ? COLLATE NOCASE')
+        params.append(file)
+    if start:
+        conditions.append(f'{time_column} >= ?')
+        params.append(start)
+    if end:
+        conditions.append(f'{time_column} <= ?')
+        params.append(end)
+    if text:
+        conditions.append(f'{text_column} LIKE ?')
+        params.append(f'%{text}%')
+    for column, value in equals:
+        if value:
+            conditions.append(f'{column} = ?')
+            params.append(value)
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query the SQLite result store of RBODLcmd.py --db')
+    parser.add_argument('database', help='Path to the result store')
+    parser.add_argument('-f', '--file', help='File name, e.g. Report.docx (not case sensitive)')
+    parser.add_argument('--from', dest='start', help="Earliest time, e.g. '2024-01-31' or '2024-01-31 13:00:00'")
+    parser.add_argument('--to', dest='end', help="Latest time, a date alone means its start, e.g. '2024-02-01'")
+    parser.add_argument('--code_file', help='ODL Code_File, e.g. SyncEngine.cpp')
+    parser.add_argument('--function', help='ODL Function, as shown in Parsed_odl, e.g. "Process Change"')
+    parser.add_argument('--sid', help='Recycle Bin UserSID')
+    parser.add_argument('--text', help='Text anywhere in the ODL parameters or the deleted file path (slow, not indexed)')
+    parser.add_argument('-n', '--limit', type=int, default=1000, help='Most rows to return, 0 = all (default 1000)')
+    parser.add_argument('--csv', help='Write the rows to this CSV file, - for stdout')
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.database):
+        print(f'Error, {args.database} does not exist!')
+        return
+    start_time = time.perf_counter()
+    columns, rows = query(args.database, args.file, args.start, args.end, args.code_file, args.function,
+                          args.sid, args.text, args.limit)
+    elapsed = time.perf_counter() - start_time
+    if args.csv:
+        f = sys.stdout if args.csv == '-' else open(args.csv, 'w', encoding='utf8', newline='')
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+        if f is not sys.stdout:
+            f.close()
+    else:
+        print('\t'.join(columns))
+        for row in rows:
+            print('\t'.join('' if value is None else str(value) for value in row))
+    print(f'{len(rows)} rows in {elapsed * 1000:.1f} ms', file=sys.stderr)
+
+if __name__ == "__main__":
+    main()